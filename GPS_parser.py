@@ -16,6 +16,9 @@ class GPS_handler:
         self.uart = UART(0, baudrate=115200 , rx=Pin(1), tx=Pin(12), stop = 1, parity = None, bits = 8 )
         self.parsed = MicropyGPS()
         self.previous_place = {'longitude' : self.parsed.longitude, 'latitude': self.parsed.latitude,'time':0}
+        self.clock_offset = None # ticks_ms at 00:00:00 UTC, see align_clock
+        self.fix_ticks = 0 # ticks_ms at which the last fix was measured
+        self.last_fix_time = 0
          
     def read_NMEA(self):
         sentence = self.uart.readline()
@@ -29,11 +32,35 @@ class GPS_handler:
     def get_GPS_data(self):
         try: 
             self.read_NMEA()
+            if self.parsed.fix_time != self.last_fix_time:
+                self.last_fix_time = self.parsed.fix_time
+                self.align_clock()
             if self.has_fix and utime.ticks_diff(self.parsed.fix_time,self.previous_place['time']) > 1000:
                 self.get_distance()
         except UnicodeError:
             pass
                 
+    def align_clock(self):
+        # A fix's UTC timestamp tells when it was measured, its parse ticks when it was received.
+        # The least delayed fixes give the lowest offset between both clocks: the offset is their
+        # minimum, leaking 1ms per fix to follow the crystals drift, and reset on jumps (midnight, cold start).
+        hours, minutes, seconds = self.parsed.timestamp
+        utc_ms = int(((hours * 60 + minutes) * 60 + seconds) * 1000)
+        candidate = utime.ticks_add(self.parsed.fix_time, -utc_ms)
+        if self.clock_offset is None or abs(utime.ticks_diff(candidate, self.clock_offset)) > 5000:
+            self.clock_offset = candidate
+        else:
+            leaked = utime.ticks_add(self.clock_offset, 1)
+            self.clock_offset = candidate if utime.ticks_diff(candidate, leaked) < 0 else leaked
+        self.fix_ticks = utime.ticks_add(self.clock_offset, utc_ms)
+
+    def poll(self, max_lines=8):
+        # Parses every sentence waiting in the UART, so fixes are used as soon as they arrive
+        lines = 0
+        while self.uart.any() and lines < max_lines:
+            self.get_GPS_data()
+            lines += 1
+
     def get_distance(self):
         speedms = self.parsed.speed[2]/3.6
         odometer_value = access_setting('odometer')
@@ -82,6 +109,7 @@ class MicropyGPS(object):
         self.crc_xor = 0
         self.char_count = 0
         self.fix_time = 0
+        self.speed_time = 0 # ticks_ms of the last parsed speed
 
         #####################
         # Sentence Statistics
@@ -281,6 +309,7 @@ class MicropyGPS(object):
             self._longitude = [lon_degs, lon_mins, lon_hemi]
             # Include mph and hm/h
             self.speed = [spd_knt, spd_knt * 1.151, spd_knt * 1.852]
+            self.speed_time = utime.ticks_ms()
             self.course = course
             self.valid = True
 
@@ -365,6 +394,7 @@ class MicropyGPS(object):
 
         # Include mph and km/h
         self.speed = (spd_knt, spd_knt * 1.151, spd_knt * 1.852)
+        self.speed_time = utime.ticks_ms()
         self.course = course
         return True
 
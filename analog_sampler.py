@@ -0,0 +1,84 @@
+from machine import Timer
+from array import array
+import micropython
+import logging
+
+MOVING_AVERAGE = 0
+MEDIAN = 1 # Rejects spikes, e.g. fuel slosh
+
+class AnalogSampler:
+    # Samples the MCP3208 channels at a fixed rate from a periodic timer, whatever function
+    # is displayed. Each channel decimates its raw samples: every `decimation` samples,
+    # one filtered value (mean or median) is published in self.values, indexed by channel.
+    def __init__(self, adc, rate_hz=50):
+        self.adc = adc
+        self.rate_hz = rate_hz
+        self.channels = bytearray()
+        self.decimations = bytearray()
+        self.filters = bytearray()
+        self.buffers = []  # Raw samples of the current decimation window, one array per channel
+        self.scratch = [] # Used to sort median windows in place
+        self.positions = bytearray() # Position in the current window of each channel
+        self.latest = array('H') # Last raw sample of every channel, in insertion order
+        self.values = array('H', [0] * 8) # Latest filtered value of every channel
+        self.updated = array('H', [0] * 8) # Incremented each time a channel's value is published
+        self.pending = False
+        self.timer = None
+
+    def add_channel(self, channel, decimation=1, filter=MOVING_AVERAGE):
+        self.channels.append(channel)
+        self.decimations.append(decimation)
+        self.filters.append(filter)
+        self.positions.append(0)
+        self.latest.append(0)
+        self.buffers.append(array('H', [0] * decimation))
+        self.scratch.append(array('H', [0] * decimation) if filter == MEDIAN else None)
+
+    def start(self):
+        for channel in self.channels: # Seeds the table so consumers never read zeros
+            self.values[channel] = self.adc.read_value(channel)
+        self._sample_ref = self.sample # Bound once here, creating them in the IRQ would allocate
+        self._timer_ref = self.timer_handler
+        self.timer = Timer(freq=self.rate_hz, mode=Timer.PERIODIC, callback=self._timer_ref)
+        logging.info(f"> Analog sampler started at {self.rate_hz}Hz on channels {list(self.channels)}")
+
+    def stop(self):
+        if self.timer:
+            self.timer.deinit()
+            self.timer = None
+
+    def timer_handler(self, timer): # Hard IRQ: only schedules the SPI work
+        if not self.pending:
+            self.pending = True
+            micropython.schedule(self._sample_ref, 0)
+
+    def sample(self, _):
+        self.pending = False
+        self.adc.scan(self.channels, self.latest)
+        for index in range(len(self.channels)):
+            channel = self.channels[index]
+            buffer = self.buffers[index]
+            decimation = self.decimations[index]
+            position = self.positions[index]
+            buffer[position] = self.latest[index]
+            position += 1
+            if position == decimation:
+                position = 0
+                if self.filters[index] == MEDIAN:
+                    self.values[channel] = self.median(buffer, self.scratch[index])
+                else:
+                    self.values[channel] = sum(buffer) // decimation
+                self.updated[channel] = (self.updated[channel] + 1) & 0xFFFF
+            self.positions[index] = position
+
+    def median(self, buffer, scratch):
+        # Insertion sort in a preallocated copy: windows are small and this doesn't allocate
+        length = len(buffer)
+        for i in range(length):
+            value = buffer[i]
+            j = i
+            while j > 0 and scratch[j - 1] > value:
+                scratch[j] = scratch[j - 1]
+                j -= 1
+            scratch[j] = value
+        return scratch[length // 2]
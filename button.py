@@ -1,36 +1,234 @@
-from machine import Pin
-import time 
+from machine import Pin, Timer, mem32
+from micropython import const
+from array import array
+import time
 import logging
 
-class Button:
-    def __init__(self, pin_number, button_id, function):
-        self.button_id = button_id
-        if self.button_id != 9:
-            self.pin = Pin(pin_number, Pin.IN, Pin.PULL_UP)
-        else:
-            self.pin = Pin(pin_number, Pin.IN, Pin.PULL_DOWN)
-        self.function = function
-        self.current_press = {'pressure':None,'release':None}
-        self.long_press = False
-        self.pin.irq(handler=lambda f: self.debounce(), trigger = Pin.IRQ_RISING | Pin.IRQ_FALLING)
-
-    def debounce(self):
-        current = time.ticks_ms()
-            
-        if self.pin.value() == (self.button_id == 9): #RISING
-            self.current_press['pressure'] = current
-        else: #FALLING
-            if time.ticks_diff(current, self.current_press['release']) > 200:
-                logging.info(f"> Pressed button: {self.button_id}")
-                self.current_press['release'] = current
-                self.check_for_long_press()
-                self.function(self.button_id,self.long_press)
-   
-    def check_for_long_press(self):
-        if time.ticks_diff(self.current_press['release'],self.current_press['pressure'])>700:
-            self.long_press = True
+EDGE_RELEASE = 0
+EDGE_PRESS = 1
+EDGE_HOLD = 2
+EDGE_CHORD = 3
+EDGE_REPEAT = 4
+
+_SIO_GPIO_IN = const(0xd0000004) # RP2040 register holding the level of every GPIO
+_MAX_BUTTONS = const(16)
+
+class InputQueue:
+    # Input events are only recorded in these preallocated buffers from interrupt context.
+    # Handlers are dispatched later from the main loop, so nothing slow (flash, display,
+    # sleeps) nor any heap allocation ever happens in interrupt context.
+    def __init__(self, size=32):
+        self.size = size
+        self.button_ids = bytearray(size)
+        self.edges = bytearray(size)
+        self.ticks = array('i', [0] * size) # ticks_ms values fit in 30 bits
+        self.masks = array('i', [0] * size) # Buttons held together, for chord events
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.functions = {}
+        self.chord_functions = {}
+        self.pressed = 0 # Bitmask of pressed button ids, kept up to date by the dispatcher
+        self.press_ticks = array('i', [0] * _MAX_BUTTONS)
+        self.release_ticks = array('i', [0] * _MAX_BUTTONS)
+        self.released = 0 # Bitmask of button ids released at least once
+        self.consumed = 0 # Buttons whose release is swallowed because they triggered a chord
+        self.held = 0 # Buttons whose long press already ran on hold, their release is swallowed too
+        self.repeating = False # Set while a handler runs for an auto-repeat of the button's last action
+
+    def register(self, button_id, function):
+        self.functions[button_id] = function
+
+    def register_chord(self, button_ids, function):
+        mask = 0
+        for button_id in button_ids:
+            mask |= 1 << button_id
+        self.chord_functions[mask] = function
+
+    def put(self, button_id, edge, ticks, mask=0): # Called from IRQ: must not allocate
+        next_head = (self.head + 1) % self.size
+        if next_head == self.tail: # Queue full, the oldest events are kept
+            self.dropped += 1
+            return
+        self.button_ids[self.head] = button_id
+        self.edges[self.head] = edge
+        self.ticks[self.head] = ticks
+        self.masks[self.head] = mask
+        self.head = next_head
+
+    def is_pressed(self, button_id):
+        return bool(self.pressed & (1 << button_id))
+
+    def released_within(self, button_id, delay):
+        if not self.released & (1 << button_id):
+            return False
+        return time.ticks_diff(time.ticks_ms(), self.release_ticks[button_id]) < delay
+
+    def dispatch(self):
+        if self.dropped:
+            logging.warn(f"> Input queue overflow, {self.dropped} events dropped")
+            self.dropped = 0
+        while self.tail != self.head:
+            index = self.tail
+            button_id = self.button_ids[index]
+            edge = self.edges[index]
+            ticks = self.ticks[index]
+            mask = self.masks[index]
+            self.tail = (index + 1) % self.size
+            self.handle(button_id, edge, ticks, mask)
+
+    def handle(self, button_id, edge, ticks, mask):
+        if edge == EDGE_PRESS:
+            self.pressed |= 1 << button_id
+            self.press_ticks[button_id] = ticks
+        elif edge == EDGE_RELEASE:
+            self.pressed &= ~(1 << button_id)
+            self.released |= 1 << button_id
+            self.release_ticks[button_id] = ticks
+            if self.consumed & (1 << button_id): # Release of a button that was part of a chord
+                self.consumed &= ~(1 << button_id)
+                return
+            if self.held & (1 << button_id): # Long press already handled while the button was down
+                self.held &= ~(1 << button_id)
+                return
+            long_press = time.ticks_diff(ticks, self.press_ticks[button_id]) > 700
+            logging.info(f"> Pressed button: {button_id}")
+            if button_id in self.functions:
+                self.functions[button_id](button_id, long_press)
+        elif edge == EDGE_HOLD or edge == EDGE_REPEAT:
+            if self.consumed & (1 << button_id) or not self.pressed & (1 << button_id):
+                return
+            if edge == EDGE_HOLD:
+                self.held |= 1 << button_id
+                logging.info(f"> Held button: {button_id}")
+            if button_id in self.functions: # mask is set when the hold repeats a short press
+                self.repeating = edge == EDGE_REPEAT or mask != 0
+                self.functions[button_id](button_id, not mask)
+                self.repeating = False
+        elif edge == EDGE_CHORD:
+            # Several buttons may have been pressed within the window, the largest
+            # registered chord they form wins
+            chord = 0
+            for chord_mask in self.chord_functions:
+                if chord_mask & mask == chord_mask and chord_mask & (1 << button_id) and chord_mask > chord:
+                    chord = chord_mask
+            if chord:
+                logging.info(f"> Pressed chord: {chord:b}")
+                self.consumed |= chord
+                self.chord_functions[chord]()
+
+
+class ButtonScanner:
+    # Samples every button in a single read of the GPIO input register from a periodic
+    # timer, instead of one IRQ per pin. Debouncing is done for all pins at once with a
+    # 2-bit vertical counter: a pin must read the same level on 4 consecutive scans
+    # before its state toggles, so contact bounce costs nothing more than a regular scan.
+    # Buttons pressed within chord_ms of each other are reported as a chord, buttons held
+    # for hold_ms get a hold event while still down, then repeat events if enabled. A button
+    # held within tap_ms of a short press repeats that short press instead of the long one.
+    def __init__(self, queue, period_ms=5, hold_ms=700, chord_ms=300, tap_ms=400):
+        self.queue = queue
+        self.period_ms = period_ms
+        self.hold_ms = hold_ms
+        self.chord_ms = chord_ms
+        self.tap_ms = tap_ms
+        self.pin_mask = 0
+        self.active_low_mask = 0
+        self.pin_numbers = bytearray(_MAX_BUTTONS)
+        self.button_ids = bytearray(_MAX_BUTTONS)
+        self.button_count = 0
+        self.state = 0 # Debounced pin levels, 1 = pressed
+        self.counter0 = 0
+        self.counter1 = 0
+        self.held = 0 # Pins whose hold event has already been sent
+        self.tapped = 0 # Pins whose last press was short
+        self.repeat_short = 0 # Pins pressed right after a short press, their hold repeats it
+        self.press_ticks = array('i', [0] * _MAX_BUTTONS)
+        self.tap_ticks = array('i', [0] * _MAX_BUTTONS) # Release of the last short press
+        self.repeat_ms = array('H', [0] * _MAX_BUTTONS) # 0: no auto-repeat
+        self.next_repeat = array('i', [0] * _MAX_BUTTONS)
+        self.timer = None
+
+    def add(self, pin_number, button_id, active_high=False, repeat_ms=0):
+        if active_high:
+            Pin(pin_number, Pin.IN, Pin.PULL_DOWN)
         else:
-            self.long_press = False
-            
-            
-        
\ No newline at end of file
+            Pin(pin_number, Pin.IN, Pin.PULL_UP)
+            self.active_low_mask |= 1 << pin_number
+        self.pin_mask |= 1 << pin_number
+        self.pin_numbers[self.button_count] = pin_number
+        self.button_ids[self.button_count] = button_id
+        self.repeat_ms[self.button_count] = repeat_ms
+        self.button_count += 1
+
+    def start(self):
+        self._scan_handler = self.scan # Bound once here, creating it in the IRQ would allocate
+        self.timer = Timer(period=self.period_ms, mode=Timer.PERIODIC, callback=self._scan_handler)
+
+    def stop(self):
+        if self.timer:
+            self.timer.deinit()
+            self.timer = None
+
+    def scan(self, timer=None): # Called from IRQ: must not allocate
+        raw = (mem32[_SIO_GPIO_IN] ^ self.active_low_mask) & self.pin_mask
+        changed = raw ^ self.state
+        self.counter0 = ~(self.counter0 & changed)
+        self.counter1 = self.counter0 ^ (self.counter1 & changed)
+        toggled = changed & self.counter0 & self.counter1
+        self.state ^= toggled
+        now = time.ticks_ms()
+
+        if toggled:
+            for index in range(self.button_count):
+                bit = 1 << self.pin_numbers[index]
+                if not toggled & bit:
+                    continue
+                button_id = self.button_ids[index]
+                if self.state & bit:
+                    self.press_ticks[index] = now
+                    if self.tapped & bit and time.ticks_diff(now, self.tap_ticks[index]) < self.tap_ms:
+                        self.repeat_short |= bit
+                    else:
+                        self.repeat_short &= ~bit
+                    self.tapped &= ~bit
+                    self.queue.put(button_id, EDGE_PRESS, now)
+                    if self.state & ~bit:
+                        chord = self.recently_pressed_ids(now)
+                        if chord & ~(1 << button_id):
+                            self.queue.put(button_id, EDGE_CHORD, now, chord)
+                else:
+                    if self.repeat_ms[index] and not self.held & bit:
+                        self.tapped |= bit
+                        self.tap_ticks[index] = now
+                    self.held &= ~bit
+                    self.queue.put(button_id, EDGE_RELEASE, now)
+
+        if self.state:
+            for index in range(self.button_count):
+                bit = 1 << self.pin_numbers[index]
+                if not self.state & bit:
+                    continue
+                if not self.held & bit:
+                    if time.ticks_diff(now, self.press_ticks[index]) > self.hold_ms:
+                        self.held |= bit
+                        self.next_repeat[index] = time.ticks_add(now, self.repeat_ms[index])
+                        self.queue.put(self.button_ids[index], EDGE_HOLD, now, 1 if self.repeat_short & bit else 0)
+                elif self.repeat_ms[index] and time.ticks_diff(now, self.next_repeat[index]) >= 0:
+                    self.next_repeat[index] = time.ticks_add(now, self.repeat_ms[index])
+                    self.queue.put(self.button_ids[index], EDGE_REPEAT, now, 1 if self.repeat_short & bit else 0)
+
+    def is_down(self, button_id):
+        # Debounced level, kept up to date by the timer: unlike InputQueue.is_pressed,
+        # it doesn't wait for the loop to dispatch the events
+        for index in range(self.button_count):
+            if self.button_ids[index] == button_id:
+                return bool(self.state & (1 << self.pin_numbers[index]))
+        return False
+
+    def recently_pressed_ids(self, now):
+        mask = 0
+        for index in range(self.button_count):
+            if self.state & (1 << self.pin_numbers[index]) and time.ticks_diff(now, self.press_ticks[index]) <= self.chord_ms:
+                mask |= 1 << self.button_ids[index]
+        return mask
@@ -0,0 +1,94 @@
+import ujson as json
+from array import array
+import logging
+
+calibration_file = 'calibration.json'
+
+# Used when calibration.json is missing: straight lines matching the original
+# sender formulas, from ADC code 0 to 4095
+DEFAULT_TABLES = {
+    'pressure': [[0, -1.29], [4095, 7.255]],  # bar:  2.59 * V - 1.29
+    'fuel': [[0, 0], [4095, 201.617]],        # L:    55 * V / 0.9
+    'voltage': [[0, 0], [4095, 9.898]],       # V:    3 * V (divider)
+    # Injector opening time (ms) against battery voltage (mV), typical of the
+    # Bosch EV1 injectors of the E30: the PIO high time includes it, no fuel flows
+    'inj_deadtime': [[6000, 3.0], [8000, 1.9], [10000, 1.35], [12000, 1.05], [14000, 0.85], [16000, 0.7]],
+}
+
+class Calibration:
+    # Piecewise-linear conversion from raw ADC codes to engineering units.
+    # Values are kept in milli-units and slopes in milli-units per code << 8,
+    # so a conversion is a binary search plus one integer multiply-add.
+    def __init__(self, points):
+        points = sorted(points)
+        if len(points) < 2:
+            raise ValueError('A calibration table needs at least 2 points')
+        self.codes = array('H', [int(point[0]) for point in points])
+        self.values = array('i', [round(point[1] * 1000) for point in points])
+        self.slopes = array('i', [0] * (len(points) - 1))
+        for i in range(len(points) - 1):
+            span = self.codes[i + 1] - self.codes[i]
+            if span == 0:
+                raise ValueError('Calibration codes must be unique')
+            self.slopes[i] = (((self.values[i + 1] - self.values[i]) << 8) + span // 2) // span
+
+    def segment(self, code):
+        # Last breakpoint <= code, clamped to the first and last segments so
+        # codes outside the table are extrapolated
+        low = 0
+        high = len(self.slopes) - 1
+        while low < high:
+            middle = (low + high + 1) >> 1
+            if self.codes[middle] <= code:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def convert(self, code):
+        i = self.segment(code)
+        return self.values[i] + (((code - self.codes[i]) * self.slopes[i]) >> 8)
+
+
+def compose(outer, inner, shift=4):
+    # Dense table of outer(inner(code)) for every ADC code >> shift, computed once so
+    # chaining two calibrations costs a single index instead of two binary searches
+    size = 4096 >> shift
+    table = array('H', [0] * size)
+    for i in range(size):
+        code = (i << shift) + (1 << shift >> 1) # Middle of the codes sharing the index
+        table[i] = max(0, min(65535, outer.convert(inner.convert(code))))
+    return table
+
+
+def load_calibrations():
+    try:
+        with open(calibration_file, 'r') as file:
+            tables = json.load(file)
+    except (OSError, ValueError):
+        logging.warn(f"> {calibration_file} not found, using default calibrations")
+        tables = {}
+    calibrations = {}
+    for name in DEFAULT_TABLES:
+        calibrations[name] = Calibration(DEFAULT_TABLES[name])
+    for name in tables:
+        try:
+            calibrations[name] = Calibration(tables[name])
+        except (ValueError, TypeError, IndexError):
+            logging.error(f"> Invalid {name} calibration table, keeping default")
+    return calibrations
+
+
+def save_calibration(name, points):
+    # Replaces one table of calibration.json, the others are kept as they are
+    try:
+        with open(calibration_file, 'r') as file:
+            tables = json.load(file)
+    except (OSError, ValueError):
+        tables = {}
+    tables[name] = points
+    try:
+        with open(calibration_file, 'w') as file:
+            json.dump(tables, file)
+    except OSError:
+        logging.error(f"> Unable to save {calibration_file}")
@@ -1,6 +1,6 @@
 import ht16k33_driver
 import time
-from button import Button
+from button import ButtonScanner, InputQueue
 from machine import Pin, I2C, SPI
 from imu import MPU6050
 from ds3231 import DS3231
@@ -23,19 +23,13 @@ def button_manager(button_id, long_press):
     display.show()
     time.sleep_ms(500)
     
-button1 = Button(4, 1, button_manager)
-button2 = Button(5, 2, button_manager)
-button3 = Button(6, 3, button_manager)
-button4 = Button(7, 4, button_manager)
-button5 = Button(8, 5, button_manager)
-button6 = Button(9, 6, button_manager)
-button7 = Button(10, 7, button_manager)
-button8 = Button(11, 8, button_manager)
-button9 = Button(12, 9, button_manager)
-button10 = Button(13, 10, button_manager)
-button11 = Button(14, 11, button_manager)
-button12 = Button(15, 12, button_manager)
-button13 = Button(20, 13, button_manager)
+inputs = InputQueue()
+buttons = ButtonScanner(inputs)
+for pin_number, button_id in [(4, 1), (5, 2), (6, 3), (7, 4), (8, 5), (9, 6), (10, 7), (11, 8),
+                              (12, 9), (13, 10), (14, 11), (15, 12), (20, 13)]:
+    buttons.add(pin_number, button_id, active_high = button_id == 9)
+    inputs.register(button_id, button_manager)
+buttons.start()
 led = Pin(15,Pin.OUT)
 led.toggle()
 
@@ -52,6 +46,7 @@ ds.datetime(datetime)
 
 
 while True:
+    inputs.dispatch()
     display.clear()
     display.show()
     adc_voltage = adc.read_voltage(2)
@@ -1,5 +1,7 @@
 from utime import sleep_ms
 from machine import I2C
+from array import array
+import micropython
 from vector3d import Vector3d
 
 
@@ -21,6 +23,19 @@ def bytes_toint(msb, lsb):
     return - (((msb ^ 255) << 8) | (lsb ^ 255) + 1)
 
 
+@micropython.viper
+def decode_be16(src: ptr8, dst: ptr16, count: int):
+    # Decodes count big endian int16 from a bytearray into an array('h'),
+    # without allocating: can be used in an interrupt handler
+    i = 0
+    while i < count:
+        dst[i] = (src[2 * i] << 8) | src[2 * i + 1]
+        i += 1
+
+
+_GYRO_MDPS_Q8 = (1954, 3908, 7805, 15610)  # 256000 / LSB per degree/s, for each gyro range
+
+
 class MPU6050(object):
     '''
     Module for InvenSense IMUs. Base class implements MPU6050 6DOF sensor, with
@@ -39,6 +54,13 @@ class MPU6050(object):
         self.buf2 = bytearray(2)                # be done in interrupt handlers
         self.buf3 = bytearray(3)
         self.buf6 = bytearray(6)
+        self.buf14 = bytearray(14)              # accel + temperature + gyro, see snapshot()
+        self._accel_scale = 16384               # LSB per g / per degree/s of the current ranges,
+        self._gyro_scale = 131                  # cached so reads don't query them over I2C
+        self._accel_shift = 14                  # Fixed point scaling: mg = raw * 1000 >> shift
+        self._gyro_mult = _GYRO_MDPS_Q8[0]      # mdps = raw * mult >> 8
+        self.raw = array('h', [0] * 7)          # accel x, y, z, temperature, gyro x, y, z of read_raw()
+        self._temperature = 0
 
         sleep_ms(200)                           # Ensure PSU and device have settled
         if isinstance(side_str, str):           # Non-pyb targets may use other than X or Y
@@ -257,6 +279,8 @@ class MPU6050(object):
                 self._write(ar_bytes[accel_range], 0x1C, self.mpu_addr)
             except OSError:
                 raise MPUException(self._I2Cerror)
+            self._accel_scale = (16384, 8192, 4096, 2048)[accel_range]
+            self._accel_shift = 14 - accel_range
         else:
             raise ValueError('accel_range can only be 0, 1, 2 or 3')
 
@@ -289,6 +313,8 @@ class MPU6050(object):
                 self._write(gr_bytes[gyro_range], 0x1B, self.mpu_addr)  # Sets fchoice = b11 which enables filter
             except OSError:
                 raise MPUException(self._I2Cerror)
+            self._gyro_scale = (131, 65.5, 32.8, 16.4)[gyro_range]
+            self._gyro_mult = _GYRO_MDPS_Q8[gyro_range]
         else:
             raise ValueError('gyro_range can only be 0, 1, 2 or 3')
 
@@ -308,13 +334,9 @@ class MPU6050(object):
             self._read(self.buf6, 0x3B, self.mpu_addr)
         except OSError:
             raise MPUException(self._I2Cerror)
-        self._accel._ivector[0] = bytes_toint(self.buf6[0], self.buf6[1])
-        self._accel._ivector[1] = bytes_toint(self.buf6[2], self.buf6[3])
-        self._accel._ivector[2] = bytes_toint(self.buf6[4], self.buf6[5])
-        scale = (16384, 8192, 4096, 2048)
-        self._accel._vector[0] = self._accel._ivector[0]/scale[self.accel_range]
-        self._accel._vector[1] = self._accel._ivector[1]/scale[self.accel_range]
-        self._accel._vector[2] = self._accel._ivector[2]/scale[self.accel_range]
+        decode_be16(self.buf6, self._accel._ivector, 3)
+        for i in range(3):
+            self._accel._vector[i] = self._accel._ivector[i]/self._accel_scale
 
     def get_accel_irq(self):
         '''
@@ -322,9 +344,7 @@ class MPU6050(object):
         unscaled integer accelerometer values
         '''
         self._read(self.buf6, 0x3B, self.mpu_addr)
-        self._accel._ivector[0] = bytes_toint(self.buf6[0], self.buf6[1])
-        self._accel._ivector[1] = bytes_toint(self.buf6[2], self.buf6[3])
-        self._accel._ivector[2] = bytes_toint(self.buf6[4], self.buf6[5])
+        decode_be16(self.buf6, self._accel._ivector, 3)
 
     # Gyro
     @property
@@ -342,13 +362,9 @@ class MPU6050(object):
             self._read(self.buf6, 0x43, self.mpu_addr)
         except OSError:
             raise MPUException(self._I2Cerror)
-        self._gyro._ivector[0] = bytes_toint(self.buf6[0], self.buf6[1])
-        self._gyro._ivector[1] = bytes_toint(self.buf6[2], self.buf6[3])
-        self._gyro._ivector[2] = bytes_toint(self.buf6[4], self.buf6[5])
-        scale = (131, 65.5, 32.8, 16.4)
-        self._gyro._vector[0] = self._gyro._ivector[0]/scale[self.gyro_range]
-        self._gyro._vector[1] = self._gyro._ivector[1]/scale[self.gyro_range]
-        self._gyro._vector[2] = self._gyro._ivector[2]/scale[self.gyro_range]
+        decode_be16(self.buf6, self._gyro._ivector, 3)
+        for i in range(3):
+            self._gyro._vector[i] = self._gyro._ivector[i]/self._gyro_scale
 
     def get_gyro_irq(self):
         '''
@@ -356,6 +372,143 @@ class MPU6050(object):
         unscaled integer gyro values. Error trapping disallowed.
         '''
         self._read(self.buf6, 0x43, self.mpu_addr)
-        self._gyro._ivector[0] = bytes_toint(self.buf6[0], self.buf6[1])
-        self._gyro._ivector[1] = bytes_toint(self.buf6[2], self.buf6[3])
-        self._gyro._ivector[2] = bytes_toint(self.buf6[4], self.buf6[5])
+        decode_be16(self.buf6, self._gyro._ivector, 3)
+
+    # Burst read
+    def snapshot(self):
+        '''
+        Reads accelerometer, temperature and gyro registers (0x3B-0x48) in a
+        single I2C transaction, so all seven values belong to the same sample.
+        Updates the accel and gyro Vector3d objects without further bus access:
+        read them with x, y, z or xyz, and the temperature with last_temperature.
+        '''
+        self.read_raw()
+        raw = self.raw
+        accel = self._accel
+        gyro = self._gyro
+        self._temperature = raw[3]
+        for i in range(3):
+            accel._ivector[i] = raw[i]
+            gyro._ivector[i] = raw[i + 4]
+            accel._vector[i] = raw[i]/self._accel_scale
+            gyro._vector[i] = raw[i + 4]/self._gyro_scale
+        accel.correct()
+        gyro.correct()
+
+    def read_raw(self):
+        '''
+        Integer fast path: burst reads the 7 int16 values into self.raw (accel
+        x, y, z, temperature, gyro x, y, z) without allocating. Can be used in
+        interrupt handlers. Error trapping disallowed.
+        '''
+        self._read(self.buf14, 0x3B, self.mpu_addr)
+        decode_be16(self.buf14, self.raw, 7)
+
+    def accel_mg(self, raw):
+        '''
+        Fixed point scaling of a raw accelerometer value to milli-g
+        '''
+        return (raw * 1000) >> self._accel_shift
+
+    def gyro_mdps(self, raw):
+        '''
+        Fixed point scaling of a raw gyro value to milli-degrees/second
+        '''
+        return (raw * self._gyro_mult) >> 8
+
+    @property
+    def last_temperature(self):
+        '''
+        Temperature in degree C of the last snapshot()
+        '''
+        return self._temperature/340 + 35
+
+    # FIFO
+    def fifo_start(self, rate_hz=200, gyro=True):
+        '''
+        Streams samples into the 1024 bytes hardware FIFO at rate_hz (4-1000Hz).
+        Each frame holds accel x, y, z then, if gyro is True, gyro x, y, z, all
+        as big endian int16: 12 bytes per frame with gyro, 6 without.
+        '''
+        if not 4 <= rate_hz <= 1000:
+            raise ValueError('FIFO rate must be between 4 and 1000Hz')
+        if self.filter_range == 0:               # Internal rate is 8kHz without low pass filter
+            self.filter_range = 3
+        self.sample_rate = 1000 // rate_hz - 1   # Internal rate is 1kHz
+        self._fifo_frame = 12 if gyro else 6
+        self.fifo_overflows = 0
+        try:
+            self._write(0x00, 0x23, self.mpu_addr)   # Stop feeding the FIFO
+            self._write(0x04, 0x6A, self.mpu_addr)   # FIFO_RESET
+            self._write(0x10, 0x38, self.mpu_addr)   # FIFO_OFLOW_EN, so overflows are flagged in INT_STATUS
+            self._write(0x78 if gyro else 0x08, 0x23, self.mpu_addr)  # ACCEL_FIFO_EN (+ XG, YG, ZG_FIFO_EN)
+            self._write(0x40, 0x6A, self.mpu_addr)   # FIFO_EN
+        except OSError:
+            raise MPUException(self._I2Cerror)
+
+    def fifo_stop(self):
+        '''
+        Stops streaming samples into the FIFO
+        '''
+        try:
+            self._write(0x00, 0x23, self.mpu_addr)
+            self._write(0x00, 0x6A, self.mpu_addr)
+        except OSError:
+            raise MPUException(self._I2Cerror)
+
+    def fifo_reset(self):
+        '''
+        Drops the FIFO content, keeps streaming
+        '''
+        try:
+            self._write(0x44, 0x6A, self.mpu_addr)   # FIFO_EN | FIFO_RESET
+        except OSError:
+            raise MPUException(self._I2Cerror)
+
+    @property
+    def fifo_count(self):
+        '''
+        Number of bytes waiting in the FIFO
+        '''
+        try:
+            self._read(self.buf2, 0x72, self.mpu_addr)
+        except OSError:
+            raise MPUException(self._I2Cerror)
+        return self.buf2[0] << 8 | self.buf2[1]
+
+    @property
+    def fifo_overflowed(self):
+        '''
+        True if the FIFO overflowed since last call. Reading INT_STATUS clears the flag.
+        '''
+        try:
+            self._read(self.buf1, 0x3A, self.mpu_addr)
+        except OSError:
+            raise MPUException(self._I2Cerror)
+        return self.buf1[0] & 0x10 > 0
+
+    def fifo_read(self, buf):
+        '''
+        Reads as many whole frames as fit in the pre-allocated buf, in a single
+        I2C transaction. Returns the number of frames read. On overflow, frames
+        can no longer be aligned: the FIFO is reset, fifo_overflows incremented
+        and 0 returned.
+        '''
+        if self.fifo_overflowed:
+            self.fifo_overflows += 1
+            self.fifo_reset()
+            return 0
+        frames = min(self.fifo_count, len(buf)) // self._fifo_frame
+        if frames:
+            try:
+                self._mpu_i2c.readfrom_mem_into(self.mpu_addr, 0x74, memoryview(buf)[:frames * self._fifo_frame])
+            except OSError:
+                raise MPUException(self._I2Cerror)
+        return frames
+
+    def fifo_decode(self, buf, frames, values):
+        '''
+        Decodes the frames returned by fifo_read into the array('h') values,
+        6 (or 3 without gyro) raw int16 per frame, without allocating.
+        '''
+        decode_be16(buf, values, frames * self._fifo_frame // 2)
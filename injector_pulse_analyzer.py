@@ -1,41 +1,90 @@
-from rp2 import PIO, asm_pio    
-    
-    
-@asm_pio(set_init=PIO.IN_LOW, autopush=True, push_thresh=32)
-def period():
-    wrap_target()
-    set(x, 0)
-    wait(0, pin, 0)  # Wait for pin to go low
-    wait(1, pin, 0)  # Low to high transition
-    label('low_high')
-    jmp(x_dec, 'next') [1]  # unconditional
-    label('next')
-    jmp(pin, 'low_high')  # while pin is high
-    label('low')  # pin is low
-    jmp(x_dec, 'nxt')
-    label('nxt')
-    jmp(pin, 'done')  # pin has gone high: all done
-    jmp('low')
-    label('done')
-    in_(x, 32)  # Auto push: SM stalls if FIFO full
-    wrap()
-    
-    
-    
-@asm_pio(set_init=PIO.IN_LOW, autopush=True, push_thresh=32)
-def pulse_width():
+from rp2 import PIO, StateMachine, asm_pio
+import time
+
+PIO_FREQ = 2_000_000 # Hz, both loops take 2 cycles: one count per µs
+EDGE_CYCLES = 4 # Cycles between the rising edge and the first high count (in_, in_, mov, mov)
+
+
+@asm_pio(autopush=True, push_thresh=32, fifo_join=PIO.JOIN_RX)
+def pulse_period():
+    wait(0, pin, 0)  # Starts on a rising edge
+    wait(1, pin, 0)
     wrap_target()
-    set(x, 0)
-    wait(0, pin, 0)  # Wait for pin to go low
-    wait(1, pin, 0)  # Low to high transition
-    label('low_high')
-    jmp(x_dec, 'next') [1] # unconditional
-    label('next')
-    jmp(pin, 'low_high')  # while pin is high
-    in_(x, 32)  # Auto push: SM stalls if FIFO full
-    irq(0)
+    mov(x, invert(null))  # Counts down from 0xffffffff, never reaches 0
+    mov(y, invert(null))
+    label('high')
+    jmp(x_dec, 'high_test')  # Unconditional
+    label('high_test')
+    jmp(pin, 'high')  # While pin is high
+    label('low')
+    jmp(pin, 'rise')  # Pin has gone high: period done
+    jmp(y_dec, 'low')  # While pin is low
+    label('rise')
+    in_(x, 32)  # Auto push, high time then low time of the same pulse
+    in_(y, 32)  # SM stalls if FIFO full
     wrap()
 
-    
-    
 
+class InjectorPulses:
+    # A single state machine measures the high time and the period of every injector pulse,
+    # pushed together as pairs so both always come from the same pulse. poll() drains the
+    # joined 8 words FIFO without blocking, summing the batch: the fuel flow only needs the
+    # duty cycle, sum of high times over sum of periods, averaged over every pulse read.
+    def __init__(self, pin, sm_id = 0):
+        self.sm = StateMachine(sm_id, pulse_period, freq=PIO_FREQ, in_base=pin, jmp_pin=pin)
+        self.high_us = 0 # Sum of the high times of the last batch
+        self.period_us = 0 # Sum of the periods of the last batch
+        self.pulses = 0 # Pulses in the last batch
+        self.last_period_us = 0 # Period of the last pulse read
+        self.last_pulse = time.ticks_ms() # When the last batch was read
+
+    def start(self):
+        self.sm.active(1)
+
+    def poll(self):
+        # Returns the number of pulses read, 0 if none since the last call
+        sm = self.sm
+        available = sm.rx_fifo()
+        if available < 2:
+            return 0
+        high_us = period_us = 0
+        pulses = available // 2 # A pair being pushed right now is left for the next call
+        for _ in range(pulses):
+            high = (sm.get() ^ 0xffffffff) + EDGE_CYCLES // 2
+            period = high + (sm.get() ^ 0xffffffff)
+            high_us += high
+            period_us += period
+        if available == 8: # FIFO was full, the SM stalled mid-pulse: resynced on the next rising edge
+            sm.restart()
+            while sm.rx_fifo(): # The stalled pair
+                sm.get()
+        self.high_us = high_us
+        self.period_us = period_us
+        self.pulses = pulses
+        self.last_period_us = period
+        self.last_pulse = time.ticks_ms()
+        return pulses
+
+
+class Tachometer:
+    # Engine speed from the injector periods, the injectors firing once per crankshaft rotation.
+    # Updated with every batch read by InjectorPulses.poll(), so it lags by less than a loop:
+    # the batch's mean period is smoothed by a moving average weighted by its number of pulses.
+    # Without any pulse for stall_ms, the engine is stopped.
+    def __init__(self, pulses, pulses_per_rotation = 1, smoothing = 0.3, stall_ms = 150):
+        self.pulses = pulses
+        self.pulses_per_rotation = pulses_per_rotation
+        self.smoothing = smoothing # Weight of a single pulse
+        self.stall_ms = stall_ms # 150ms is 400rpm, below idle
+        self.rpm = 0
+
+    def update(self, count):
+        # count: pulses returned by the last poll()
+        if count:
+            rpm = 60_000_000 * count / (self.pulses.period_us * self.pulses_per_rotation)
+            if self.rpm:
+                self.rpm += (rpm - self.rpm) * min(1, self.smoothing * count)
+            else: # Engine just started, nothing to smooth
+                self.rpm = rpm
+        elif self.rpm and time.ticks_diff(time.ticks_ms(), self.pulses.last_pulse) > self.stall_ms:
+            self.rpm = 0
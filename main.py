@@ -18,18 +18,27 @@
 # -----------------------------------------------------------------------------
 
 import time
-from math import log
 import ht16k33_driver                # Display's driver
 from GPS_parser import GPS_handler   #
-from button import Button            #
+from button import ButtonScanner, InputQueue # Button scanner and its event queue
 from imu import MPU6050              # Accelerometer
 from mcp3208 import MCP3208          # Analog to digital converter
+from analog_sampler import AnalogSampler, MOVING_AVERAGE, MEDIAN # Background ADC sampling
+from thermistor import Thermistor    # Precomputed temperature sensors conversion
+from calibration import Calibration, load_calibrations, compose, save_calibration # Senders and injector dead time calibrations
+from mounting import Mounting, MountingCalibrator # IMU orientation in the car
+from motion import MotionFilter      # Longitudinal and lateral accelerations
 from dictionnary import Dictionnary  # Used for translations
 from unit import Unit                # Handles metric to imperial conversions
 from machine import I2C, Pin, RTC, WDT, SPI, ADC, time_pulse_us, Timer
-from timer import Timer_, LapTimer    #
+from timer import Timer_, LapTimer, signed_position #
+from tracks import TrackDatabase     # Known circuits, their start/finish and sector gates
+from records import LapStore, RunStore # Lap and performance run histories, saved to flash
+from performance import PerformanceMeter # Acceleration and braking measurements
+from trip import TripComputer, TRIPS # Trips fuel used, average consumption and range
+from tank import TankLearner         # Fuel sender curve, learnt from the injected fuel
 import ujson as json                 #
-from memory import access_setting    #
+from memory import access_setting, add_default_settings #
 import fota_master                   # Handles Over The Air Firmware updates
 from FOTA import connect_to_wifi, is_connected_to_wifi, server
 from FOTA.ota import OTAUpdater      #
@@ -37,9 +46,7 @@ import os                            #
 import logging                       #
 from ds3231 import DS3231            # Real time clock
 import gc                            # Garbage collector, used to free up unused memory
-import injector_pulse_analyzer       #
-from rp2 import StateMachine         # StateMachine allow for PIO support, used in fuel consumption
-                                     # for precise timing of injector pulses
+from injector_pulse_analyzer import InjectorPulses, Tachometer # PIO timing of the injector pulses, used in fuel consumption and rpm
                 
 class OBC:
     def __init__(self):
@@ -62,23 +69,30 @@ class OBC:
                 pass
                 
         
+        add_default_settings() # Settings missing from an older data.json
         self.display.brightness(access_setting('display_brightness'))
         
-        #self.buttonX = Button(pin_number, button_id, function)
-        self.button1 = Button(4, 1, self.function_manager)
-        self.button2 = Button(5, 2, self.function_manager)
-        self.button3 = Button(6, 3, self.function_manager)
-        self.button4 = Button(7, 4, self.function_manager)
-        self.button5 = Button(8, 5, self.function_manager)
-        self.button6 = Button(9, 6, self.function_manager)
-        self.button7 = Button(10, 7, self.function_manager)
-        self.button8 = Button(11, 8, self.function_manager)
-        self.button9 = Button(20, 9, self.set_reset)       #TODO:TROUBLESHOOTING PIN INVERSION
-        self.button10 = Button(13, 10, self.digit_manager)
-        self.button11 = Button(14, 11, self.digit_manager)
-        self.button12 = Button(15, 12, self.digit_manager)
-        self.button13 = Button(12, 13, self.digit_manager) #TODO:TROUBLESHOOTING PIN INVERSION
-        self.stalk_button = Button(21, 14, self.stalk_handler)
+        # Buttons are sampled together by a timer-driven scanner which only queues events,
+        # self.inputs.dispatch() runs the handlers from the loop.
+        # Long presses are handled as soon as the button is held, digit buttons then auto-repeat:
+        # down when only held, up when held right after a tap.
+        self.inputs = InputQueue()
+        self.buttons = ButtonScanner(self.inputs)
+        #(pin_number, button_id, function)
+        buttons = [(4, 1, self.function_manager), (5, 2, self.function_manager), (6, 3, self.function_manager),
+                   (7, 4, self.function_manager), (8, 5, self.function_manager), (9, 6, self.function_manager),
+                   (10, 7, self.function_manager), (11, 8, self.function_manager),
+                   (20, 9, self.set_reset),       #TODO:TROUBLESHOOTING PIN INVERSION
+                   (13, 10, self.digit_manager), (14, 11, self.digit_manager), (15, 12, self.digit_manager),
+                   (12, 13, self.digit_manager),  #TODO:TROUBLESHOOTING PIN INVERSION
+                   (21, 14, self.stalk_handler)]
+        for pin_number, button_id, function in buttons:
+            repeat_ms = 200 if function == self.digit_manager else 0
+            self.buttons.add(pin_number, button_id, active_high = button_id == 9, repeat_ms = repeat_ms)
+            self.inputs.register(button_id, function)
+        # Setting menu accessed by pressing 1000 + 10 together (within 300ms)
+        self.inputs.register_chord((10, 12), self.open_setting_menu)
+        self.buttons.start()
         
         self.digit_pressed = 0
        
@@ -93,14 +107,45 @@ class OBC:
         self.rpi_rtc.datetime(self.rtc.datetime())
 
         self.timer = Timer_()
-        self.laptimer = LapTimer()
-        self.acceleration_timer = Timer_()
+        self.tracks = TrackDatabase()
+        self.lap_store = LapStore()
+        self.laptimer = LapTimer(tracks = self.tracks, store = self.lap_store)
+        self.current_track = None # Track the car is at, the lap timer is armed once per arrival
+        self.performance_target = 1 # Index of the target shown, in self.performance.targets
+        self.performance_target_shown = 0
+        # Rotates sensor accelerations into the car's axes (forward, left, up),
+        # solved by set_imu_mounting while the car is stationary
+        self.mounting = Mounting(access_setting('imu_mount'))
 
         self.gps = GPS_handler()
+        # Drains the IMU FIFO in background, g_sensor and acceleration read its filtered output.
+        # Its speed estimate, predicted from the IMU between GPS fixes, is read through get_speed()
+        self.motion = MotionFilter(self.mpu, self.mounting, self.gps)
+        self.motion.start()
+        # Times 0-100, quarter mile, braking... from the GPS fixes and the IMU launch detection
+        self.performance = PerformanceMeter(self.gps, self.motion, rollout = access_setting('rollout') == 'ON')
+        self.run_store = RunStore()
+        self.performance.listeners.append(self.record_run)
         self.speed_limit = 0
         self.speed_limit_is_active = False
         self.max_oil_temperature = 0
         self.oil_temperature_limit_is_active = False
+        # Analog inputs are sampled at 50Hz in background, whatever function is displayed.
+        # Gauges and alerts read the filtered values from self.sampler.values[channel]
+        self.sampler = AnalogSampler(self.adc, rate_hz = 50)
+        self.sampler.add_channel(0, 25, MOVING_AVERAGE) # Oil temperature, 2Hz
+        self.sampler.add_channel(1, 5, MOVING_AVERAGE)  # Oil pressure, 10Hz
+        self.sampler.add_channel(2, 10, MOVING_AVERAGE) # Voltage, 5Hz
+        self.sampler.add_channel(3, 50, MOVING_AVERAGE) # Outside temperature, 1Hz
+        self.sampler.add_channel(4, 51, MEDIAN)         # Fuel level, 1Hz, median rejects slosh
+        self.sampler.start()
+        # Piecewise-linear ADC code -> unit tables, from calibration.json
+        self.calibrations = load_calibrations()
+        # Steinhart-Hart coefficients and voltage dividers of the temperature sensors
+        self.oil_thermistor = Thermistor('oil', 1.291780e-3, 2.612878e-4, 1.568296e-7,
+                                         lambda voltage: (5000/voltage) - 1000)
+        self.out_thermistor = Thermistor('out', 1.327871e-3, 2.297980e-4, 1.375199e-7,
+                                         lambda voltage: (voltage * 4.7) / (5 - voltage))
         
         language = access_setting("language")
         self.words = Dictionnary(language).words
@@ -111,19 +156,29 @@ class OBC:
         self.cabin_light = Pin(22, Pin.IN, Pin.PULL_DOWN)
         self.cabin_light.irq(handler = self.cabin_light_handler, trigger = Pin.IRQ_RISING | Pin.IRQ_FALLING)
         
+        shift_rpm = access_setting('shift_rpm')
+        self.shift_rpm = shift_rpm if shift_rpm and shift_rpm != 'OFF' else 0 # The display blinks above it, 0 disables
+        self.shift_light_on = False
+
         if self.wiring == "OBC": #fuel related inits
             self.injector_pulse = Pin(27, Pin.IN)
             self.injector_cc = access_setting("inj_cc")
             self.cyl_nb = access_setting("cyl_nb")
             self.inj_cal = access_setting("inj_cal")
-            self.sm0 = StateMachine(0, injector_pulse_analyzer.pulse_width, in_base=self.injector_pulse, jmp_pin=self.injector_pulse)
-            self.sm1 = StateMachine(1, injector_pulse_analyzer.period, in_base=self.injector_pulse, jmp_pin=self.injector_pulse)
-            self.new_sample = False
-            self.sm0.irq(self.pulseIrqHandler)
-            # The statemachine enters an infinite loop if the engine is stopped,
-            # so we use an interrupt system to check if injector pulse is detected
-            self.sm0.active(1)
-            self.sm1.active(1)
+            # Single state machine pushing (high time, period) pairs. It never pushes while the
+            # engine is stopped, so its FIFO is polled without blocking by sample_injectors, at every loop
+            self.injectors = InjectorPulses(self.injector_pulse)
+            self.fuel_flow = 0.0 # L/h
+            self.tachometer = Tachometer(self.injectors)
+            # Injector dead time (µs) by voltage ADC code >> 4, through the voltage calibration
+            self.injector_deadtime = compose(self.calibrations['inj_deadtime'], self.calibrations['voltage'])
+            self.injectors.start()
+            # Integrates fuel flow and speed into trips A, B and since the last refuel
+            self.trips = TripComputer()
+            # Pairs the fuel sender with the fuel used since the refuel to correct its calibration
+            self.tank_learner = TankLearner()
+            self.fuel_level_updated = self.sampler.updated[4]
+            self.displayed_trip = 0 # Index in trip.TRIPS
     
             
 
@@ -153,7 +208,8 @@ class OBC:
         self.display.clear()
         self.display.show()
         self.mpu = MPU6050(i2c, device_addr = 1)
-        spi = SPI(0, sck=Pin(18),mosi=Pin(19),miso=Pin(16), baudrate=50000)
+        self.mpu.fifo_start(200) # Motion is sampled at 200Hz by the IMU itself, see MotionFilter
+        spi = SPI(0, sck=Pin(18),mosi=Pin(19),miso=Pin(16), baudrate=MCP3208.BAUDRATE)
         spi_cs = Pin(17, Pin.OUT)
         self.adc = MCP3208(spi, spi_cs)
     
@@ -164,15 +220,23 @@ class OBC:
             logging.debug("> System powered on")
             self.pwr_pin.high()
             self.init_communication()
+            self.sampler.adc = self.adc
+            self.motion.mpu = self.mpu
             self.led.high()
         else:
-            while self.cabin_light_handler() and not self.button9.pin.value() and not self.get_ignition_status():                
+            set_down = self.buttons.is_down(9) # Still down when the power off comes from a SET long press
+            while self.cabin_light_handler() and not self.get_ignition_status(): # Events aren't dispatched here
+                if self.buttons.is_down(9) and not set_down: # Only a new press dismisses the warning
+                    break
+                set_down = self.buttons.is_down(9)
                 self.display.put_text('LIGHTS') #TODO: DICTIONNARY FOR LIGHT
                 self.display.show()
                 self.display.blink_rate(1)
                 time.sleep_ms(50)
             if not self.get_ignition_status() or trigger == "SET_press":
                 logging.debug("> System powered off")
+                if self.wiring == 'OBC':
+                    self.trips.pause()
                 self.display.clear()
                 self.display.blink_rate(0)
                 self.display.show()
@@ -219,7 +283,7 @@ class OBC:
         if self.wiring == 'A.CLOCK':
             functions_list.remove(self.out_temperature)
         if self.wiring != 'OBC':
-            fuel_related_functions = [self.fuel_range, self.remaining_fuel, self.inst_hourly_fuel_cons, self.inst_mpg]
+            fuel_related_functions = [self.fuel_range, self.remaining_fuel, self.inst_hourly_fuel_cons, self.inst_mpg, self.trip, self.engine_speed]
             for function in fuel_related_functions:
                 if function in functions_list:
                     functions_list.remove(function)
@@ -232,7 +296,7 @@ class OBC:
             self.power_handler()
             return 
         supported_functions = [self.hour, self.date, self.speed, self.acceleration, self.lap_timer, self.inst_hourly_fuel_cons,
-                               self.inst_mpg, self.fuel_range, self.remaining_fuel, self.odometer, self.timer_function, self.pressure,
+                               self.inst_mpg, self.trip, self.fuel_range, self.remaining_fuel, self.engine_speed, self.odometer, self.timer_function, self.pressure,
                                self.oil_temperature, self.out_temperature, self.voltage, self.altitude, self.heading, self.g_sensor]
         
         available_functions = self.available_function_manager(supported_functions)
@@ -274,7 +338,7 @@ class OBC:
 
             elif button_id == 5:
                 if self.wiring == "OBC":
-                    fuel_related_functions = [self.inst_hourly_fuel_cons, self.inst_mpg, self.fuel_range, self.remaining_fuel, self.odometer]
+                    fuel_related_functions = [self.inst_hourly_fuel_cons, self.inst_mpg, self.trip, self.fuel_range, self.remaining_fuel, self.engine_speed, self.odometer]
                     if not self.displayed_function in fuel_related_functions or self.displayed_function == self.odometer:
                         self.displayed_function = self.inst_hourly_fuel_cons
                     else:
@@ -341,30 +405,33 @@ class OBC:
         if self.displayed_function in (self.set_hour, self.set_date, self.set_year, self.set_limit, self.set_odometer_thousands,
                                        self.set_odometer_hundreds, self.set_max_oil_temperature, self.set_setting, self.set_language,
                                        self.set_clock_format, self.set_unit,self.set_wiring,self.set_display_brightness,self.set_sensors,
-                                       self.set_auto_off,self.set_gsensor_error, self.set_logging, self.set_injector_cc, self.set_cyl_nb,
-                                       self.set_injector_calibration):
+                                       self.set_auto_off,self.set_imu_mounting, self.set_logging, self.set_injector_cc, self.set_cyl_nb,
+                                       self.set_injector_calibration, self.set_rollout, self.set_shift_light, self.lap_timer, self.acceleration, self.trip):
+            if self.displayed_function == self.lap_timer and self.inputs.repeating:
+                return # A digit held down doesn't add a sector gate every 200ms
             if not long_press: 
                 digit_map = {10: 1000, 11: 100, 12: 10, 13:1}
                 self.digit_pressed = digit_map.get(button_id)
             else: # Long presses decrements the digit by their corresponding values
                 digit_map = {10: -1000, 11: -100, 12: -10,13:-1}
                 self.digit_pressed = digit_map.get(button_id)
-        else:
-            # Setting menu accessed by simultaneously pressing 1000 + 10 
-            if (button_id == 10 and not self.button12.pin.value()) or (button_id == 12 and not self.button10.pin.value()):
-                self.displayed_function = self.set_setting
-                self.display.fill() #To check for potential dead pixels
-                self.display.show()
-                time.sleep_ms(2000)
+
+    def open_setting_menu(self):
+        self.last_use = time.ticks_ms()
+        if self.can_switch_function:
+            self.displayed_function = self.set_setting
+            self.display.fill() #To check for potential dead pixels
+            self.display.show()
+            time.sleep_ms(2000)
 
     def set_reset(self, button_id, long_press):
         self.last_use = time.ticks_ms()
         self.digit_pressed = 0
         setting_functions = [self.set_language, self.set_clock_format, self.set_unit,
                      self.sw_update, self.set_display_brightness, self.set_sensors,
-                     self.set_wiring, self.set_auto_off, self.set_gsensor_error,
+                     self.set_wiring, self.set_auto_off, self.set_imu_mounting,
                      self.set_logging, self.set_injector_cc, self.set_cyl_nb,
-                     self.set_injector_calibration]
+                     self.set_injector_calibration, self.set_rollout, self.set_shift_light]
 
         if not long_press:
             if not self.powered:
@@ -407,8 +474,7 @@ class OBC:
                     self.laptimer.start()
             
             elif self.displayed_function == self.acceleration:
-                if self.acceleration_timer.start_time is not None:
-                    self.acceleration_timer.reset()
+                self.performance.reset()
                 
             
             elif self.displayed_function == self.speed:
@@ -429,6 +495,9 @@ class OBC:
                 self.can_switch_function = True
                 
                 
+            elif self.displayed_function == self.trip:
+                self.trips.reset(TRIPS[self.displayed_trip])
+
             elif self.displayed_function == self.odometer:
                 self.display.blink_rate(0)
                 self.displayed_function = self.set_odometer_thousands
@@ -485,17 +554,13 @@ class OBC:
             self.display.put_text(text)
             self.display.show()
 
-    def show_function_name(self, button): # Shows function's name when corresponding button is pressed
-        now = time.ticks_ms()
-        if time.ticks_diff(now, button.current_press['release']) < 700 or time.ticks_diff(now, self.stalk_button.current_press['release']) < 700:
-            return True
-        else:
-            return False
+    def show_function_name(self, button_id): # Shows function's name when corresponding button is pressed
+        return self.inputs.released_within(button_id, 700) or self.inputs.released_within(14, 700) # 14: stalk
 
 # ---------------------------OBC FUNCTIONS-----------------------------
 
     def hour(self):
-        if self.show_function_name(self.button1):
+        if self.show_function_name(1):
             self.show(self.words['HOUR'])
         else:
             current_time = self.rtc.datetime()
@@ -549,7 +614,7 @@ class OBC:
                 
 
     def date(self):
-        if self.show_function_name(self.button1):
+        if self.show_function_name(1):
             self.show(self.words['DATE'])
         else:
             current_time = self.rtc.datetime()
@@ -621,23 +686,29 @@ class OBC:
             
             
     def speed(self):
-        if self.show_function_name(self.button2):
+        if self.show_function_name(2):
             self.show(self.words['SPEED'])
-        elif self.show_function_name(self.button9):
+        elif self.show_function_name(9):
             if self.speed_limit_is_active:
                 self.show('  ON  ')
             else:
                 self.show(' OFF  ')
         else:
-            if self.gps.has_fix():
-                speed = self.gps.parsed.speed[self.unit.speed_index]
+            speed = self.get_speed()
+            if speed is not None:
                 self.show(str(int(speed))+self.unit.speed_acronym)
             else:
                 self.show(self.words['SIGNAL'])
+
+    def get_speed(self):
+        # GPS speed refined by the IMU at 50Hz, in the displayed unit. None without GPS
+        if self.motion.speed.valid:
+            return self.motion.speed.kmh * self.unit.speed_factor
+        return None
                 
                 
     def set_limit(self):
-        if self.show_function_name(self.button9):
+        if self.show_function_name(9):
             self.show(self.words['LIMIT'])
         else:
             digit_mapping = {
@@ -662,14 +733,14 @@ class OBC:
 
     def check_for_overspeed(self):
         if not self.displayed_function == self.set_limit and self.can_switch_function:
-            if self.gps.has_fix():
-                current_speed = self.gps.parsed.speed[self.unit.speed_index]
+            current_speed = self.get_speed()
+            if current_speed is not None:
                 gone_overspeed = False
                 switching = True
                 if current_speed > self.speed_limit and self.speed_limit_is_active:
                     logging.car("> Entering overspeed at {current_speed}")
-                while current_speed > self.speed_limit and self.speed_limit_is_active and self.gps.has_fix():
-                    self.watchdog.feed()
+                while current_speed is not None and current_speed > self.speed_limit and self.speed_limit_is_active:
+                    #self.watchdog.feed()
                     self.last_displayed_function = self.displayed_function
                     self.displayed_function = self.check_for_overspeed
                     gone_overspeed = True
@@ -682,63 +753,83 @@ class OBC:
                         self.show(str(int(current_speed)) + self.unit.speed_acronym)
                     start = time.ticks_ms()
                     while time.ticks_diff(time.ticks_ms(),start) < 1000:
-                        pass
-                    self.gps.get_GPS_data()
-                    current_speed = self.gps.parsed.speed[self.unit.speed_index]
+                        self.inputs.dispatch() # SET press disables the alert
+                        self.gps.poll()
+                        if self.wiring == 'OBC': # Still driving, the trips keep counting
+                            self.update_trips()
+                    current_speed = self.get_speed()
                 if gone_overspeed:
                     self.display.blink_rate(0)
                     self.can_switch_function = True
                     self.displayed_function = self.last_displayed_function
     
     def acceleration(self):
-        if self.show_function_name(self.button3):
+        if self.show_function_name(3):
             self.show(self.words['ACCEL'])
         else:
+            targets = self.performance.targets
+            if self.digit_pressed: # Digits browse the targets, all of them are timed anyway
+                self.performance_target = (self.performance_target + (1 if self.digit_pressed > 0 else -1)) % len(targets)
+                self.performance_target_shown = time.ticks_add(time.ticks_ms(), 2500) # Name, then all-time best
+                self.digit_pressed = 0
+            target = targets[self.performance_target]
             if self.gps.has_fix():
-                # if the acceleration timer is not running yet
-                if not self.acceleration_timer.is_running and self.acceleration_timer.start_time == None and not self.acceleration_timer.show_lap_time():
-                    acceleration = self.mpu.accel
-                    self.display.blink_rate(0)
+                if self.performance.show_result():
+                    self.display.blink_rate(5)
+                    self.can_switch_function = False
+                    name = self.performance.last_result
+                    self.show(self.format_performance(name, self.performance.results[name]))
+                else:
                     self.can_switch_function = True
-                    if self.gps.parsed.speed[2] > 2:
+                    recall = time.ticks_diff(self.performance_target_shown, time.ticks_ms())
+                    best = self.run_store.best(target['name'])
+                    if recall > 1500 or (recall > 0 and best is None):
+                        self.show(target['name'])
+                    elif recall > 0:
+                        self.show(self.format_performance(target['name'], best))
+                    elif self.performance.running(target['name']):
+                        self.show(self.timer.parse_time(self.performance.elapsed(target['name'])))
+                    elif target.get('start', 0) == 0 and self.motion.speed.kmh > 2: # Standing starts
                         self.show(self.words['STOP'])
                     else:
                         self.show(self.words['READY'])
-                    
-                    if acceleration.x > 0.5 and self.gps.parsed.speed[2] < 2:
-                        self.acceleration_timer.start()
-                else:
-                    # Acceleration timer is running
-                    speed_target = 100 #kmh
-                    if self.gps.parsed.speed[2] >= speed_target and self.acceleration_timer.is_running:
-                        self.acceleration_timer.display_end_time = time.ticks_add(time.ticks_ms(),4000)
-                        self.display.blink_rate(5)
-                        self.can_switch_function = False
-                        time_to_100 = self.acceleration_timer.parse_time(self.acceleration_timer.get_elapsed_time())
-                        logging.car(f"> {speed_target}kmh reached in {time_to_100}.")
-                        self.acceleration_timer.reset()
-                    if self.acceleration_timer.show_lap_time():
-                        pass
-                    else:
-                        time_to_show = self.acceleration_timer.get_elapsed_time()
-                        self.show(self.acceleration_timer.parse_time(time_to_show))
-                    
             else:
                 self.show(self.words['SIGNAL'])
 
+    def format_performance(self, name, result):
+        for target in self.performance.targets:
+            if target['name'] == name:
+                if target.get('end', 1) == 0: # Braking, the distance matters
+                    if self.unit.system == 'METRIC':
+                        distance = result['distance']
+                    elif self.unit.system == 'IMPERI.':
+                        distance = result['distance'] * 3.28084
+                    return '{:.1f}'.format(distance) + self.unit.altitude_acronym
+                return self.timer.parse_time(result['time'])
+
+
+    def record_run(self, target, result):
+        # PerformanceMeter listener, stores the run with the conditions it was done in
+        temperature = None
+        if self.wiring != 'A.CLOCK': # No outside temperature sensor
+            temperature = self.out_thermistor.celsius(self.sampler.values[3])
+        slope = None
+        if result['distance'] >= 100: # GPS altitude is too noisy for shorter runs
+            slope = result['climb'] / result['distance'] * 100
+        self.run_store.add_run(target, result, temperature, self.gps.parsed.altitude, slope, self.performance.rollout)
 
     def lap_timer(self):
-        if self.show_function_name(self.button4):
+        if self.show_function_name(4):
             self.show(self.words['LAP'])
         else:  
             if self.gps.has_fix():
-                if self.laptimer.is_running:
-                    if self.laptimer.start_position is None:
-                        self.laptimer.set_start_position(self.gps.parsed)
-                    # Program goes faster than GPS updates, so we dismiss repetitive coordinates
-                    if self.gps.parsed.longitude != self.gps.previous_place['longitude'] and self.gps.parsed.latitude != self.gps.previous_place['latitude']:
-                        self.laptimer.check_for_completed_lap(self.gps.parsed) 
-                    
+                if self.laptimer.is_running: # Crossings are checked in the loop, whatever function is displayed
+                    if self.digit_pressed: # Digits add a sector gate where the car is
+                        if self.digit_pressed > 0:
+                            self.laptimer.add_sector(self.gps.parsed)
+                        else: # Long press, saves the line set by hand as a new track
+                            self.laptimer.save_track()
+                        self.digit_pressed = 0
                     # At the end of a lap, we display the time, the delay with the fastest lap (if any), and the number of laps. 
                     if self.laptimer.show_lap_time():
                         self.display.blink_rate(5)
@@ -751,7 +842,7 @@ class OBC:
                         if self.laptimer.delay > 0:
                             timer_str = str(self.laptimer.parse_time(self.laptimer.delay, '+'))
                         else:
-                            timer_str = str(self.laptimer.parse_time(self.laptimer.delay, '-'))
+                            timer_str = str(self.laptimer.parse_time(-self.laptimer.delay, '-'))
                         
                     elif self.laptimer.show_laps():
                         self.display.blink_rate(5)
@@ -760,13 +851,27 @@ class OBC:
                             timer_str = str(self.laptimer.number_of_lap - 1)+'  LAP'
                         else:
                             timer_str = str(self.laptimer.number_of_lap - 1)+' LAP'
+                    elif self.laptimer.show_split(): # Sector time, or its delta with the best one
+                        self.display.blink_rate(5)
+                        self.can_switch_function = False
+                        number, sector_time, delta = self.laptimer.split
+                        if delta is None:
+                            timer_str = self.laptimer.parse_time(sector_time)
+                        else:
+                            timer_str = self.laptimer.parse_time(abs(delta), '+' if delta > 0 else '-')
+                        if timer_str.startswith('  '):
+                            timer_str = 'S' + str(number) + timer_str[2:]
                     else:
                         self.can_switch_function = True
-                        self.display.blink_rate(0)
-                        time_to_show = self.laptimer.get_elapsed_lap_time()
-                        timer_str = self.laptimer.parse_time(time_to_show)
+                        live_delta = self.laptimer.live_delta
+                        if live_delta is not None: # Ahead or behind the fastest lap at this point of the track
+                            timer_str = self.laptimer.parse_time(abs(live_delta), '+' if live_delta > 0 else '-')
+                        else:
+                            time_to_show = self.laptimer.get_elapsed_lap_time()
+                            timer_str = self.laptimer.parse_time(time_to_show)
                     self.show(str(timer_str))
                 else: # If lap timer is not running 
+                    self.digit_pressed = 0
                     if self.laptimer.show_laps():
                         self.display.blink_rate(5)
                         self.can_switch_function = False
@@ -777,42 +882,55 @@ class OBC:
                         self.can_switch_function = False
                         timer_str = self.laptimer.parse_time(self.laptimer.fastest_lap[0])
                     else:
-                        self.display.blink_rate(0)
                         self.can_switch_function = True
-                        timer_str = self.words['READY']  
+                        if self.laptimer.armed: # Starts on the first crossing of the line
+                            timer_str = self.laptimer.track['name']
+                        else:
+                            timer_str = self.words['READY']  
                     self.show(str(timer_str))
             else:
                 self.show(self.words['SIGNAL'])
                 
-    def pulseIrqHandler(self,sm):
-        if not self.new_sample:
-            self.new_sample = True
+    def check_for_track(self):
+        # Arms the lap timer when arriving at a known track, unless it still holds the laps of a
+        # session: those stay shown until SET resets the timer, which then arms it on the track
+        if not self.gps.has_fix() or self.laptimer.is_running:
+            return
+        track = self.tracks.find(*signed_position(self.gps.parsed))
+        if track is not self.current_track:
+            self.current_track = track
+            if track and self.laptimer.idle:
+                self.laptimer.arm(track)
+
+    def update_trips(self):
+        # At every loop, and in the alerts' wait loops so a blocked loop doesn't lose fuel
+        self.sample_injectors()
+        if self.shift_rpm:
+            self.check_shift_light()
+        self.trips.update(self.fuel_flow, self.motion.speed.kmh if self.motion.speed.valid else 0)
+        if self.sampler.updated[4] != self.fuel_level_updated: # New fuel sender median, once a second
+            self.fuel_level_updated = self.sampler.updated[4]
+            self.learn_tank_level()
+
+    def sample_injectors(self):
+        # Non blocking, averaged over every pulse since the last call
+        pulses = self.injectors.poll()
+        self.tachometer.update(pulses)
+        if pulses:
+            # The injectors only flow once open, after a dead time depending on the battery voltage
+            open_us = self.injectors.high_us - pulses * self.injector_deadtime[self.sampler.values[2] >> 4]
+            duty_cycle = max(0, open_us) / self.injectors.period_us
+            injector_cc_per_second = self.injector_cc / 60
+            fuel_per_second_cc = (self.inj_cal / 100) * duty_cycle * injector_cc_per_second * self.cyl_nb / 2
+            self.fuel_flow = (fuel_per_second_cc * 3600) / 1000
+        elif time.ticks_diff(time.ticks_ms(), self.injectors.last_pulse) > 150: # No pulse for 150ms: below 400rpm, engine stopped
+            self.fuel_flow = 0.0
 
     def get_hourly_fuel_cons(self):
-            time.sleep_ms(150) #timeout waiting for a new sample. Corresponds to 400rpm
-            if self.new_sample:
-                pulse_width = scale(self.sm0.get())
-                period = scale(self.sm1.get())
-                rpm = (1/(period/1000))* 60 
-                self.new_sample = False
-                print(f"rpm {rpm:.2f} period {period:.2f} pw {pulse_width:.2f}")
-
-                injector_cc_per_ms = self.injector_cc / 60_000 
-                fuel_per_pulse_cc = pulse_width * injector_cc_per_ms
-                total_fuel_per_rot_cc = fuel_per_pulse_cc * self.cyl_nb / 2
-                rotations_per_second = 1 / (period / 1_000)
-                fuel_per_second_cc = (self.inj_cal / 100) * total_fuel_per_rot_cc * rotations_per_second
-                fuel_per_hour_liters = (fuel_per_second_cc * 3600) / 1000 
-                #print(f"Period: {period:.2f} ms Frequency: {1000/period:.2f} Hz Pulse_width: {pulse_width:.2f}, L/h = {fuel_per_hour_liters:.2f}")
-            else:
-                fuel_per_hour_liters = 0
-            return fuel_per_hour_liters
-                
+        return self.fuel_flow
+
     def inst_hourly_fuel_cons(self):
-        def scale(v):
-            return (1 + (v ^ 0xffffffff)) * 24e-6  # Scale to ms
-        
-        if self.show_function_name(self.button5):
+        if self.show_function_name(5):
             self.show(' L/H ') #TODO: Words for fuel
         else:
             fuel_per_hour_liters = self.get_hourly_fuel_cons()
@@ -820,7 +938,7 @@ class OBC:
                 
 
     def inst_mpg(self):
-        if self.show_function_name(self.button5):
+        if self.show_function_name(5):
             self.show('L/100 ') #TODO: Words for fuel
         else:
             fuel_per_hour_liters = self.get_hourly_fuel_cons()
@@ -832,26 +950,82 @@ class OBC:
             self.show("{:<3.1f}L/1.".format(fuel_per_100km))
             
             
+    def trip(self):
+        if self.show_function_name(5):
+            self.show('TRIP') #TODO: Words for fuel
+        else:
+            if self.digit_pressed: # Digits browse the trips, SET resets the one shown
+                self.displayed_trip = (self.displayed_trip + (1 if self.digit_pressed > 0 else -1)) % len(TRIPS)
+                self.digit_pressed = 0
+            name = TRIPS[self.displayed_trip]
+            consumption = self.trips.consumption(name)
+            if consumption is None:
+                self.show(name[0] + ' ----')
+            else:
+                self.show(name[0] + "{:>5.1f}".format(consumption))
+
     def fuel_range(self):
-        if self.show_function_name(self.button5):
+        if self.show_function_name(5):
             self.show('RANGE') #TODO: Words for fuel
         else:
-            self.show('9999KM')
+            if time.ticks_diff(time.ticks_ms(), self.refresh_rate_adjuster['timestamp']) > 1000:
+                self.refresh_rate_adjuster['timestamp'] = time.ticks_ms()
+                fuel_range = self.trips.range(self.get_tank_level())
+                if self.unit.system == 'METRIC':
+                    unit = 'KM'
+                elif self.unit.system == 'IMPERI.':
+                    unit = 'MI'
+                    if fuel_range is not None:
+                        fuel_range *= 0.621371
+                if fuel_range is None: # Not enough distance driven since the refuel yet
+                    self.show('----' + unit)
+                else:
+                    self.show("{:>4}".format(min(9999, int(fuel_range))) + unit)
+
+    def get_tank_level(self):
+        return self.calibrations['fuel'].convert(self.sampler.values[4]) / 1000
+
+    def learn_tank_level(self):
+        if self.tank_learner.feed(self.sampler.values[4], self.trips.trips['REFUEL'][0]):
+            self.tank_learner.save()
+            points = self.tank_learner.fit(self.calibrations['fuel'])
+            if points:
+                self.calibrations['fuel'] = Calibration(points)
+                save_calibration('fuel', points)
 
     def remaining_fuel(self):
-        if self.show_function_name(self.button5):
+        if self.show_function_name(5):
             self.show('FUEL')
         else:
             if time.ticks_diff(time.ticks_ms(), self.refresh_rate_adjuster['timestamp']) > 500:
                 self.refresh_rate_adjuster['timestamp'] = time.ticks_ms()
-                voltage = self.adc.read_voltage(4)
-                fuel = 55*voltage/0.9
+                fuel = self.get_tank_level()
                 fuel_str = '{:<5}L'.format(round(fuel,0))
                 self.show(fuel_str) 
 
 
+    def engine_speed(self):
+        if self.show_function_name(5):
+            self.show('RPM')
+        else:
+            if time.ticks_diff(time.ticks_ms(), self.refresh_rate_adjuster['timestamp']) > 200:
+                self.refresh_rate_adjuster['timestamp'] = time.ticks_ms()
+                self.show("{:>6}".format(int(self.tachometer.rpm) // 10 * 10))
+
+    def check_shift_light(self):
+        self.shift_light_on = self.tachometer.rpm >= self.shift_rpm
+
+    def update_blink(self):
+        # The blink of every screen left free to switch, at every loop. Settings being changed
+        # and alerts blink the display their own way, the shift light comes back once they end.
+        # The driver only writes the display on a change
+        if not self.can_switch_function:
+            return
+        setting = self.displayed_function.__name__.startswith('set_') # Settings menu
+        self.display.blink_rate(2 if self.shift_light_on and not setting else 0)
+
     def odometer(self):
-        if self.show_function_name(self.button5):
+        if self.show_function_name(5):
             self.show(self.words['ODO'])
         else:
             value = access_setting('odometer')
@@ -909,12 +1083,11 @@ class OBC:
         
         
     def timer_function(self):
-        if self.show_function_name(self.button6) and not self.timer.is_displayed:
+        if self.show_function_name(6) and not self.timer.is_displayed:
             self.show(self.words['TIMER'])
         else:
             if not self.timer.show_lap_time():
                 self.can_switch_function = True
-                self.display.blink_rate(0)
                 time_to_show = self.timer.get_elapsed_time()
             else:
                 self.can_switch_function = False
@@ -925,8 +1098,7 @@ class OBC:
             self.show(timer_str)
     
     def get_pressure(self):
-        read_voltage = self.adc.read_voltage(1)
-        bar_pressure = 2.59 * read_voltage - 1.29
+        bar_pressure = self.calibrations['pressure'].convert(self.sampler.values[1]) / 1000
         if bar_pressure < 0.2:
             bar_pressure = 0
         psi_pressure = round(bar_pressure * 14.5038,1)
@@ -937,7 +1109,7 @@ class OBC:
         
         
     def pressure(self):
-        if self.show_function_name(self.button7):
+        if self.show_function_name(7):
             self.show(self.words['OIL'])
         else:
             if time.ticks_diff(time.ticks_ms(), self.refresh_rate_adjuster['timestamp']) > 300:
@@ -954,29 +1126,9 @@ class OBC:
         
     def get_temperature(self, string, sensor):
         if sensor == "oil":
-            voltage = self.adc.read_voltage(0)
-            try:
-                RNTC = (5000/voltage) - 1000
-            except ZeroDivisionError: #TODO: No sensor detection
-                RNTC = 10000            
-            A = 1.291780e-3
-            B = 2.612878e-4
-            C = 1.568296e-7
+            celsius_temperature = self.oil_thermistor.celsius(self.sampler.values[0])
         elif sensor == "out":
-            voltage = self.adc.read_voltage(3)
-            try:
-                RNTC = (voltage * 4.7) / (5 - voltage)
-            except ZeroDivisionError: #TODO: No sensor detection
-                RNTC = 10000
-            A = 1.327871e-3
-            B = 2.297980e-4
-            C = 1.375199e-7
-        try:
-            temperature = 1 /( A + B * log(RNTC) + C *(log(RNTC))**3)
-        except:
-            logging.exception(f"> Error while computing temperature. RNTC value: {RNTC}")
-            temperature = 222
-        celsius_temperature = temperature - 273.15
+            celsius_temperature = self.out_thermistor.celsius(self.sampler.values[3])
         fahrenheit_temperature = (celsius_temperature *  1.8) + 32
         if self.unit.system == 'METRIC':
             temperature_to_show = celsius_temperature
@@ -989,32 +1141,23 @@ class OBC:
     
     
     def oil_temperature(self):
-        if self.show_function_name(self.button7):
+        if self.show_function_name(7):
             self.show(self.words['TEMP'])
-        elif self.show_function_name(self.button9):
+        elif self.show_function_name(9):
             if self.oil_temperature_limit_is_active:
                 self.show('  ON  ')
             else:
                 self.show(' OFF  ')
         else:
-            try:
-                self.refresh_rate_adjuster['values'].append(self.get_temperature(False, "oil"))
-            except MemoryError:
-                logging.exception(f"> MemoryError in self.refresh_rate_updater. Array lenght: {len(self.refresh_rate_adjuster['values'])}") 
-            
+            # Already averaged by the background sampler
             if time.ticks_diff(time.ticks_ms(), self.refresh_rate_adjuster['timestamp']) > 1000:
-                if len(self.refresh_rate_adjuster['values']) > 2:
-                    rounded_temperature = sum(self.refresh_rate_adjuster['values']) / len(self.refresh_rate_adjuster['values'])
-                    self.show(self.temperature_formatter(rounded_temperature))
-                    self.refresh_rate_adjuster['values'].clear()
-                else:
-                    self.show(self.get_temperature(True, "oil"))
+                self.show(self.get_temperature(True, "oil"))
                 self.refresh_rate_adjuster['timestamp'] = time.ticks_ms()
             
                     
     
     def set_max_oil_temperature(self):
-        if self.show_function_name(self.button9):
+        if self.show_function_name(9):
             self.show(' MAX.')
         else:
             digit_mapping = {100: 100, 10: 10, 1: 1, -1: -1, -10: -10, -100: -100, -1000: -1000}
@@ -1027,14 +1170,14 @@ class OBC:
             self.show(max_oil_temperature_str)
     
     def check_for_overheat(self):
-        if not self.displayed_function == set_max_oil_temperature and self.can_switch_function:
+        if not self.displayed_function == self.set_max_oil_temperature and self.can_switch_function:
             oil_temperature = int(self.get_temperature(False, "oil"))
             switching = True
             gone_overheat = False
             if oil_temperature > self.max_oil_temperature and self.oil_temperature_limit_is_active:
                 logging.car(f"> Oil overheating! Temperature: {oil_temperature}")
             while oil_temperature > self.max_oil_temperature and self.oil_temperature_limit_is_active:
-                self.watchdog.feed()
+                #self.watchdog.feed()
                 self.displayed_function = self.check_for_overheat
                 self.can_switch_function = False
                 gone_overheat = True
@@ -1048,8 +1191,10 @@ class OBC:
                 switching = not switching
                 start = time.ticks_ms()
                 while time.ticks_diff(time.ticks_ms(), start) < 1000:
-                    pass
-                temperature = int(self.get_temperature(False, "oil"))
+                    self.inputs.dispatch() # SET press disables the alert
+                    if self.wiring == 'OBC': # Still driving, the trips keep counting
+                        self.update_trips()
+                oil_temperature = int(self.get_temperature(False, "oil"))
             if gone_overheat:
                 logging.car("> Stopped overheating.")
                 self.display.blink_rate(0)
@@ -1058,29 +1203,20 @@ class OBC:
         
     
     def out_temperature(self): #TODO: <3 degrees alert
-        if self.show_function_name(self.button7):
+        if self.show_function_name(7):
             self.show('OUTEMP') #TODO: Words for outside temp
         else:
-            try:
-                self.refresh_rate_adjuster['values'].append(self.get_temperature(False, "out"))
-            except MemoryError:
-                logging.exception(f"> MemoryError in self.refresh_rate_updater. Array lenght: {len(self.refresh_rate_adjuster['value'])}")
+            # Already averaged by the background sampler
             if time.ticks_diff(time.ticks_ms(), self.refresh_rate_adjuster['timestamp']) > 1000:
-                if len(self.refresh_rate_adjuster['values']) > 2:
-                    rounded_temperature = sum(self.refresh_rate_adjuster['values']) / len(self.refresh_rate_adjuster['values'])
-                    self.show(self.temperature_formatter(rounded_temperature))
-                    self.refresh_rate_adjuster['values'].clear()
-                else:
-                    self.show(self.get_temperature(True, "out"))
+                self.show(self.get_temperature(True, "out"))
                 self.refresh_rate_adjuster['timestamp'] = time.ticks_ms()
         
     def get_voltage(self):
-        adc_voltage = self.adc.read_voltage(2)
-        battery_voltage = adc_voltage * 3
+        battery_voltage = self.calibrations['voltage'].convert(self.sampler.values[2]) / 1000
         return battery_voltage
     
     def voltage(self):
-        if self.show_function_name(self.button7):
+        if self.show_function_name(7):
             self.show(self.words['VOLT'])
         else:
             if time.ticks_diff(time.ticks_ms(), self.refresh_rate_adjuster['timestamp']) > 1000:
@@ -1089,7 +1225,7 @@ class OBC:
                 self.show(' ' + battery_voltage_str + 'V')
 
     def altitude(self):
-        if self.show_function_name(self.button8):
+        if self.show_function_name(8):
             self.show(self.words['ALT'])
         else:
             if self.gps.has_fix():
@@ -1102,7 +1238,7 @@ class OBC:
                 self.show(self.words['SIGNAL'])
 
     def heading(self):
-        if self.show_function_name(self.button8):
+        if self.show_function_name(8):
             self.show(self.words['HDG'])
         else:
             if self.gps.has_fix():
@@ -1113,15 +1249,19 @@ class OBC:
                 self.show(self.words['SIGNAL'])
 
     def g_sensor(self):
-        if self.show_function_name(self.button8):
+        if self.show_function_name(8):
             self.show(self.words['G SENS'])
         else:
-            if time.ticks_diff(time.ticks_ms(), self.refresh_rate_adjuster['timestamp']) > 200:
-                g_error = access_setting('g_error')
+            if time.ticks_diff(time.ticks_ms(), self.refresh_rate_adjuster['timestamp']) > 100:
                 self.refresh_rate_adjuster['timestamp'] = time.ticks_ms()
-                acceleration = self.mpu.accel
-                g_vector = ((acceleration.x + (g_error[0]/10)) ** 2 + (acceleration.z + (g_error[1]/10)) **2) ** 0.5
-                self.show(' ' + str(round(g_vector, 1)) + 'G')
+                # Peak-held horizontal g, prefixed by its main component:
+                # A: accelerating, B: braking, C: cornering
+                longitudinal = self.motion.longitudinal
+                if abs(longitudinal) >= abs(self.motion.lateral):
+                    direction = 'A' if longitudinal >= 0 else 'B'
+                else:
+                    direction = 'C'
+                self.show(direction + '{:.1f}'.format(self.motion.peak) + 'G')
                 
 # ----------------------------SETTINGS FUNCTIONS-------------------------------
 
@@ -1129,13 +1269,13 @@ class OBC:
         digit_mapping = {10,1,-1,-10}
         if self.digit_pressed in digit_mapping:
             self.setting_index+=self.digit_pressed
-            if self.setting_index>12 or self.setting_index < 0:
+            if self.setting_index>14 or self.setting_index < 0:
                 self.setting_index = 0
             self.digit_pressed = 0
         self.show('SET{:>3}'.format(str(self.setting_index)))
     
     def set_language(self):
-        if self.show_function_name(self.button9):
+        if self.show_function_name(9):
             self.show('LANGUA.')
         else:
             language = access_setting('language')
@@ -1153,7 +1293,7 @@ class OBC:
             self.show(access_setting('language'))
     
     def set_clock_format(self):
-        if self.show_function_name(self.button9):
+        if self.show_function_name(9):
             self.show('12/24')
         else:
             clock_format = access_setting('clock_format')
@@ -1167,7 +1307,7 @@ class OBC:
                 self.digit_pressed = 0
             
     def set_unit(self):
-        if self.show_function_name(self.button9):
+        if self.show_function_name(9):
             self.show('UNIT')
         else:
             unit = access_setting('unit')
@@ -1185,7 +1325,7 @@ class OBC:
             self.show(access_setting('unit'))
     
     def sw_update(self):
-        if self.show_function_name(self.button9):
+        if self.show_function_name(9):
             self.show('UPDATE')
         else:
             self.show(' WIFI ')
@@ -1221,7 +1361,8 @@ class OBC:
                 firmware_url = "https://github.com/80sEngineering/E30-OBC/"
                 files_to_update = ["button.py", "dictionnary.py", "ds3231.py", "fota_master.py",
                                    "GPS_parser.py","ht16k33_driver.py","imu.py","logging.py",
-                                   "main.py", "mcp3208.py", "memory.py", "timer.py", "unit.py",
+                                   "main.py", "mcp3208.py", "analog_sampler.py", "calibration.py", "memory.py", "motion.py", "mounting.py", "performance.py", "records.py", "trip.py", "tank.py", "injector_pulse_analyzer.py",
+                                   "thermistor.py", "timer.py", "tracks.py", "unit.py",
                                    "vector3d.py","version.json"]
                 ota_updater = OTAUpdater(firmware_url, files_to_update)
                 ota_updater.check_for_updates()
@@ -1246,11 +1387,17 @@ class OBC:
                 logging.debug(f"> Something went wrong, going into setup mode.")
                 fota_master.setup_mode()
             
+            self.add_export_routes()
             server.run()
 
+    def add_export_routes(self):
+        # Records stored on flash, downloadable from the web server
+        server.add_route("/laps.csv", handler = lambda request: (self.lap_store.csv(), 200, "text/csv"), methods = ["GET"])
+        server.add_route("/runs.csv", handler = lambda request: (self.run_store.csv(), 200, "text/csv"), methods = ["GET"])
+
             
     def set_display_brightness(self):
-        if self.show_function_name(self.button9):
+        if self.show_function_name(9):
             self.show('BRIGHT')
         else:
             brightness = self.display.brightness()
@@ -1265,7 +1412,7 @@ class OBC:
                 
     
     def set_sensors(self):
-        if self.show_function_name(self.button9):
+        if self.show_function_name(9):
             self.show('SENSOR')
         else:
             sensors = access_setting('sensors')
@@ -1279,7 +1426,7 @@ class OBC:
             
                 
     def set_wiring(self):
-        if self.show_function_name(self.button9):
+        if self.show_function_name(9):
             self.show('WIRING')
         else:
             wiring = access_setting('wiring')
@@ -1294,7 +1441,7 @@ class OBC:
             
             
     def set_auto_off(self):
-        if self.show_function_name(self.button9):
+        if self.show_function_name(9):
             self.show('AUT.OFF')
         else:
             auto_off_delay = access_setting('auto_off_delay')
@@ -1309,26 +1456,63 @@ class OBC:
                             
                 
                 
-    def set_gsensor_error(self):
-        if self.show_function_name(self.button9):
-            self.show('G.ERROR')
+    def set_imu_mounting(self):
+        # Any digit starts the calibration, or restarts it, which must be done with the car stopped on level ground.
+        # Leaving the screen doesn't stop it, the mounting is saved as soon as it is solved
+        if self.show_function_name(9):
+            self.show('G.CALIB')
         else:
-            g_error = access_setting('g_error')
-            self.show('X'+str(g_error[0])+'Y'+str(g_error[1]))
-            x_digit_mapping = [10, -10]
-            y_digit_mapping = [1, -1]
-            if self.digit_pressed in x_digit_mapping:
-                if -10 <= g_error[0] + self.digit_pressed / 10 < 10:
-                     g_error[0] += int(self.digit_pressed / 100)
-                access_setting('g_error',g_error)
-            elif self.digit_pressed in y_digit_mapping:
-                if -10 < g_error[1] + self.digit_pressed < 10:
-                    g_error[1] += int(self.digit_pressed/10)
-                access_setting('g_error',g_error)
-            self.digit_pressed = 0
-    
+            if self.digit_pressed: # Fed by the motion filter
+                self.motion.calibrator = MountingCalibrator(self.mounting, on_done = self.save_imu_mounting)
+            calibrator = self.motion.calibrator
+            if calibrator is None:
+                self.show('CAL')
+            elif calibrator.done:
+                self.show('DONE')
+            elif calibrator.moving:
+                self.show('WAIT') # The car moves, the calibration restarts
+            else:
+                self.show('{:>3}%'.format(calibrator.progress))
+        self.digit_pressed = 0
+
+    def save_imu_mounting(self, setting):
+        access_setting('imu_mount', setting)
+
+    def set_rollout(self):
+        # Standing starts timed after the first foot, as on drag strips
+        if self.show_function_name(9):
+            self.show('ROLLOUT')
+        else:
+            rollout = 'ON' if access_setting('rollout') == 'ON' else 'OFF'
+            self.show(rollout)
+            if self.digit_pressed in [1,-1]:
+                rollout = 'OFF' if rollout == 'ON' else 'ON'
+                access_setting('rollout', rollout)
+                self.performance.rollout = rollout == 'ON'
+                self.digit_pressed = 0
+
+    def set_shift_light(self):
+        if self.show_function_name(9):
+            self.show('SHIFT')
+        else:
+            if self.shift_rpm:
+                self.show("{:>6}".format(self.shift_rpm))
+            else:
+                self.show(' OFF  ')
+            if self.digit_pressed in {1000, 100, -100, -1000}:
+                if not self.shift_rpm:
+                    shift_rpm = 3000 if self.digit_pressed > 0 else 8000
+                else:
+                    shift_rpm = self.shift_rpm + self.digit_pressed
+                    if shift_rpm < 3000 or shift_rpm > 8000: # Past either end, the shift light is off
+                        shift_rpm = 0
+                access_setting('shift_rpm', shift_rpm or 'OFF')
+                self.shift_rpm = shift_rpm
+                self.shift_light_on = False # Until the next check, never if turned off
+                self.digit_pressed = 0
+
     def set_logging(self):
-        if self.show_function_name(self.button9):
+        if self.show_function_name(9):
             self.show('LOG')
         else:
             all_logging_types = [0b111111,0b111110,0]
@@ -1347,7 +1531,7 @@ class OBC:
             self.digit_pressed = 0
             
     def set_injector_cc(self):
-        if self.show_function_name(self.button9):
+        if self.show_function_name(9):
             self.show('INJ. CC')
         else:
             injector_cc = access_setting("inj_cc")
@@ -1365,7 +1549,7 @@ class OBC:
             
     
     def set_cyl_nb(self):
-        if self.show_function_name(self.button9):
+        if self.show_function_name(9):
             self.show('CYL. NB')
         else:
             cyl_nb = access_setting("cyl_nb")
@@ -1384,7 +1568,7 @@ class OBC:
                 
                     
     def set_injector_calibration(self):        
-        if self.show_function_name(self.button9):
+        if self.show_function_name(9):
             self.show('INJ.CAL.')
         else:
             calibration_factor = access_setting('inj_cal')
@@ -1405,13 +1589,24 @@ class OBC:
     def loop(self):
         while True:
             #self.watchdog.feed()
+            self.inputs.dispatch() # Runs the handlers of the buttons pressed since last iteration
             if self.powered:
+                self.gps.poll() # Every iteration, so the speed estimate is corrected as soon as a fix arrives
+                if self.laptimer.is_running or self.laptimer.armed:
+                    self.laptimer.update(self.gps)
+                self.performance.update()
+                if self.wiring == 'OBC':
+                    self.update_trips()
                 self.displayed_function()
+                self.update_blink()
                 if self.priority_counter == self.priority_interval[1] or  self.priority_counter == self.priority_interval[2]: #1/20 occurence
-                    self.gps.get_GPS_data() #computing travelled distance
+                    self.motion.stationary = self.gps.parsed.speed[2] < 1 if self.gps.has_fix() else None
                     self.led.toggle()
                 if self.priority_counter == self.priority_interval[2]: #1/40 occurence
                     gc.collect() # freeing memory space
+                    self.check_for_track()
+                    if self.wiring == 'OBC':
+                        self.trips.check_refuel(self.get_tank_level(), self.motion.stationary is True)
                     self.check_for_last_use()
                     if self.wiring in ['D.CLOCK','OBC'] and self.power_on_trigger == 'Ignition':
                         if not self.get_ignition_status():
@@ -2,28 +2,48 @@ import machine
 import time
 
 class MCP3208:
+    BAUDRATE = 1_000_000 # Max SPI clock of the MCP3208 at 3.3V
+
     def __init__(self, spi, cs, ref_voltage=3.3):
         self.cs = cs
         self.cs.value(1) # ncs on
         self._spi = spi
         self._ref_voltage = ref_voltage
-    
+        # Pre-allocated buffers: reads don't allocate and can be done from timer callbacks
+        self._tx = bytearray(3)
+        self._rx = bytearray(3)
+        # Start bit + single-ended mode + channel number, for each channel
+        self._commands = bytes(192 | (pin << 3) for pin in range(8))
+
     def read_value(self, pin):
-        cmd = 128  # 1000 0000
-        cmd += 64  # 1100 0000
-        cmd += ((pin & 0x07) << 3)
-        config_bits = bytearray([cmd,0x00,0x00])
-        response = bytearray(3)
-        self.cs.value(0) 
-        self._spi.write_readinto(config_bits, response)
+        self._tx[0] = self._commands[pin & 0x07]
+        return self._convert()
+
+    def _convert(self):
+        self.cs.value(0)
+        self._spi.write_readinto(self._tx, self._rx)
         self.cs.value(1)
-        adc_value = (response[0] & 0x01) << 11  # only B11 is here
-        adc_value |= response[1] << 3           # B10:B3
-        adc_value |= response[2] >> 5           # MSB has B2:B0 ... need to move down to LSB
+        adc_value = (self._rx[0] & 0x01) << 11  # only B11 is here
+        adc_value |= self._rx[1] << 3           # B10:B3
+        adc_value |= self._rx[2] >> 5           # MSB has B2:B0 ... need to move down to LSB
         return adc_value
-    
+
+    def scan(self, channels, values, oversample=1):
+        # Reads every channel of `channels` into the caller's array('H') `values`.
+        # `oversample` is either a number of conversions averaged for every channel
+        # or a sequence giving it per channel.
+        per_channel = not isinstance(oversample, int)
+        for index in range(len(channels)):
+            self._tx[0] = self._commands[channels[index] & 0x07]
+            samples = oversample[index] if per_channel else oversample
+            total = 0
+            for _ in range(samples):
+                total += self._convert()
+            values[index] = total // samples
+        return values
+
+    def to_voltage(self, adc_value):
+        return self._ref_voltage * adc_value / 4096
+
     def read_voltage(self,pin):
-        adc_value = self.read_value(pin)
-        voltage_value = 3.3 * adc_value / 4096
-        return voltage_value
-        
\ No newline at end of file
+        return self.to_voltage(self.read_value(pin))
@@ -1,6 +1,10 @@
 import ujson as json
 import logging
 
+# Settings added after the first release: units in the field have a data.json without them,
+# and access_setting only writes keys already there
+DEFAULT_SETTINGS = {'imu_mount': None, 'rollout': 'OFF', 'shift_rpm': 'OFF'}
+
 def access_setting(setting_type, data_to_write = None):
     try:
         with open('data.json', 'r') as file:
@@ -18,4 +22,19 @@ def access_setting(setting_type, data_to_write = None):
             data[setting_type] = data_to_write
             json.dump(data, file)
             file.close()
-        
+
+def add_default_settings():
+    # At boot, before any setting is read
+    try:
+        with open('data.json', 'r') as file:
+            data = json.load(file)
+    except:
+        logging.error("> Settings not found")
+        return
+    missing = [key for key in DEFAULT_SETTINGS if key not in data]
+    if missing:
+        for key in missing:
+            data[key] = DEFAULT_SETTINGS[key]
+        with open('data.json', 'w') as file:
+            json.dump(data, file)
+        logging.info(f"> Settings added: {missing}")
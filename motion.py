@@ -0,0 +1,201 @@
+from machine import Timer
+from array import array
+from math import pi
+import micropython
+import time
+import logging
+
+_MDPS_TO_RAD = pi / 180000
+_G_TO_KMH_S = 9.80665 * 3.6
+
+class MotionFilter:
+    # Sole consumer of the MPU6050 FIFO. At each tick, the 200Hz frames queued by the IMU are
+    # averaged (rejecting engine vibrations), rotated into the car's axes by the mounting, then
+    # fed to a complementary filter: the gravity estimate is propagated with the gyro and slowly
+    # pulled towards the measured acceleration, only while its norm is close to 1g (otherwise the
+    # car accelerates, brakes or corners and the gyro alone is trusted). What remains once gravity
+    # is removed is the car's own acceleration, published in g as longitudinal (+ accelerating) and lateral (+ to the right).
+    # With a GPS, it is also integrated into self.speed, a SpeedEstimator updated at the same rate.
+    def __init__(self, mpu, mounting, gps=None, rate_hz=50, fifo_rate=200, gravity_tau=2.0, gravity_window=15, output_tau=0.15, peak_hold_ms=1500):
+        self.mpu = mpu
+        self.mounting = mounting
+        self.rate_hz = rate_hz
+        self.fifo_rate = fifo_rate
+        self.gravity_tau = gravity_tau # s, longer trusts the gyro more
+        self.gravity_window = gravity_window # mg, max difference between 1g and a measure used to correct gravity
+        self.output_tau = output_tau # s, low-pass of the published values
+        self.peak_hold_ms = peak_hold_ms
+        self.frames = bytearray(1020) # Up to 85 FIFO frames (accel + gyro) read at once
+        self.values = array('h', [0] * 510) # The same frames, decoded
+        self.accel = array('i', [0, 0, 0]) # mg, car's axes, gravity included
+        self.rate = array('i', [0, 0, 0]) # mdps, car's axes
+        self.gravity = [0.0, 0.0, 1000.0] # mg, car's axes
+        self.gyro_bias = [0.0, 0.0, 0.0] # mdps, learnt while stationary
+        self.longitudinal = 0.0 # g
+        self.lateral = 0.0 # g
+        self.peak = 0.0 # g, horizontal
+        self.peak_ticks = time.ticks_ms()
+        self.stationary = None # Set by the owner from GPS speed, None without fix. True enables the gyro bias learning
+        self.calibrator = None # MountingCalibrator fed with every sensor frame while set
+        self.speed = SpeedEstimator(gps) if gps else None
+        self.launch_armed = False # Frames are checked one by one for a launch while set
+        self.launch_threshold = 150 # mg, longitudinal
+        self.launch_ticks = None # ticks_ms of the frame the launch was detected in
+        self.samples = 0 # Processed frames, wraps around
+        self.initialized = False
+        self.pending = False
+        self.timer = None
+
+    def start(self):
+        self._update_ref = self.update # Bound once here, creating them in the IRQ would allocate
+        self._timer_ref = self.timer_handler
+        self.timer = Timer(freq=self.rate_hz, mode=Timer.PERIODIC, callback=self._timer_ref)
+        logging.info(f"> Motion filter started at {self.rate_hz}Hz")
+
+    def stop(self):
+        if self.timer:
+            self.timer.deinit()
+            self.timer = None
+
+    def timer_handler(self, timer): # Hard IRQ: only schedules the I2C work
+        if not self.pending:
+            self.pending = True
+            micropython.schedule(self._update_ref, 0)
+
+    def arm_launch(self):
+        self.launch_ticks = None
+        self.launch_armed = True
+
+    def update(self, _=None):
+        self.pending = False
+        mpu = self.mpu
+        frames = mpu.fifo_read(self.frames)
+        if not frames:
+            return
+        now = time.ticks_ms() # Reception time of the last frame
+        mpu.fifo_decode(self.frames, frames, self.values)
+        values = self.values
+        ax = ay = az = gx = gy = gz = 0
+        for frame in range(frames):
+            index = frame * 6
+            ax += values[index]
+            ay += values[index + 1]
+            az += values[index + 2]
+            gx += values[index + 3]
+            gy += values[index + 4]
+            gz += values[index + 5]
+            if self.calibrator:
+                self.calibrator.feed(mpu.accel_mg(values[index]), mpu.accel_mg(values[index + 1]),
+                                     mpu.accel_mg(values[index + 2]), self.stationary is True) # GPS speed 0
+            if self.launch_armed: # At 200Hz, the launch time is known within 5ms
+                forward = self.mounting.forward(mpu.accel_mg(values[index]), mpu.accel_mg(values[index + 1]),
+                                                mpu.accel_mg(values[index + 2])) - self.gravity[0]
+                if forward > self.launch_threshold:
+                    self.launch_ticks = time.ticks_add(now, -((frames - 1 - frame) * 1000 // self.fifo_rate))
+                    self.launch_armed = False
+        self.samples = (self.samples + frames) & 0x3FFFFFFF
+        self.mounting.transform(mpu.accel_mg(ax // frames), mpu.accel_mg(ay // frames),
+                                mpu.accel_mg(az // frames), self.accel)
+        self.mounting.rotate(mpu.gyro_mdps(gx // frames), mpu.gyro_mdps(gy // frames),
+                             mpu.gyro_mdps(gz // frames), self.rate)
+        self.fuse(frames / self.fifo_rate)
+
+    def fuse(self, dt):
+        accel = self.accel
+        gravity = self.gravity
+        bias = self.gyro_bias
+        if not self.initialized:
+            for i in range(3):
+                gravity[i] = accel[i]
+            self.initialized = True
+        if self.stationary is True: # Whatever the gyro reads now is its bias
+            k = dt / (2 + dt)
+            for i in range(3):
+                bias[i] += (self.rate[i] - bias[i]) * k
+        # Gravity is fixed in the world, so in the car's frame it rotates opposite to the car
+        wx = (self.rate[0] - bias[0]) * dt * _MDPS_TO_RAD
+        wy = (self.rate[1] - bias[1]) * dt * _MDPS_TO_RAD
+        wz = (self.rate[2] - bias[2]) * dt * _MDPS_TO_RAD
+        x, y, z = gravity
+        x, y, z = x + y * wz - z * wy, y + z * wx - x * wz, z + x * wy - y * wx
+        if abs((accel[0] ** 2 + accel[1] ** 2 + accel[2] ** 2) ** 0.5 - 1000) < self.gravity_window:
+            alpha = self.gravity_tau / (self.gravity_tau + dt)
+        else:
+            alpha = 1
+        gravity[0] = alpha * x + (1 - alpha) * accel[0]
+        gravity[1] = alpha * y + (1 - alpha) * accel[1]
+        gravity[2] = alpha * z + (1 - alpha) * accel[2]
+        longitudinal = (accel[0] - gravity[0]) / 1000
+        if self.speed:
+            self.speed.update(dt, longitudinal)
+        beta = dt / (self.output_tau + dt)
+        self.longitudinal += (longitudinal - self.longitudinal) * beta
+        self.lateral += ((gravity[1] - accel[1]) / 1000 - self.lateral) * beta # The car's y axis points left
+        magnitude = self.magnitude
+        now = time.ticks_ms()
+        if magnitude >= self.peak or time.ticks_diff(now, self.peak_ticks) > self.peak_hold_ms:
+            self.peak = magnitude
+            self.peak_ticks = now
+
+    @property
+    def magnitude(self):
+        return (self.longitudinal ** 2 + self.lateral ** 2) ** 0.5
+
+    def reset_peak(self):
+        self.peak = 0.0
+        self.peak_ticks = time.ticks_ms()
+
+
+class SpeedEstimator:
+    # One state Kalman filter on speed (km/h): predicted between GPS fixes by integrating the
+    # longitudinal acceleration, corrected each time the GPS parses a new speed. The residuals
+    # also slowly learn the accelerometer's longitudinal bias, so predictions drift less.
+    def __init__(self, gps, gps_sigma=0.5, accel_sigma=0.05, bias_gain=0.05, timeout_ms=3000):
+        self.gps = gps
+        self.gps_variance = gps_sigma ** 2 # km²/h², GPS speed noise
+        self.gps_sigma = gps_sigma
+        self.process_variance = (accel_sigma * _G_TO_KMH_S) ** 2 # km²/h² per s, acceleration noise
+        self.bias_gain = bias_gain
+        self.timeout_ms = timeout_ms # Without GPS speed for that long, the estimate is dropped
+        self.kmh = 0.0
+        self.variance = 1e4 # Unknown until the first fix
+        self.bias = 0.0 # g
+        self.speed_time = 0 # GPS speed_time of the last correction
+        self.elapsed = 0.0 # s of prediction since the last correction
+
+    def update(self, dt, longitudinal):
+        # longitudinal: unfiltered acceleration along the car's axis, in g, gravity removed
+        self.kmh += (longitudinal - self.bias) * _G_TO_KMH_S * dt
+        if self.kmh < 0: # The OBC can't tell reversing from braking
+            self.kmh = 0.0
+        self.variance += self.process_variance * dt
+        self.elapsed += dt
+        parsed = self.gps.parsed
+        if parsed.speed_time != self.speed_time:
+            self.speed_time = parsed.speed_time
+            if self.gps.has_fix():
+                self.correct(parsed.speed[2])
+
+    def correct(self, measured):
+        residual = measured - self.kmh
+        gain = self.variance / (self.variance + self.gps_variance)
+        self.kmh += gain * residual
+        self.variance *= 1 - gain
+        if self.elapsed > 0 and measured > 5: # Too many GPS artefacts when stopped
+            self.bias -= self.bias_gain * residual / (_G_TO_KMH_S * self.elapsed)
+        self.elapsed = 0.0
+
+    @property
+    def valid(self):
+        return self.speed_time != 0 and time.ticks_diff(time.ticks_ms(), self.speed_time) < self.timeout_ms
+
+    @property
+    def sigma(self):
+        return self.variance ** 0.5 # km/h, one standard deviation
+
+    @property
+    def confidence(self):
+        # 100 right after a GPS speed, decreasing as the prediction drifts, 0 without GPS
+        if not self.valid:
+            return 0
+        return min(100, int(100 * self.gps_sigma / self.sigma))
@@ -0,0 +1,138 @@
+from array import array
+from math import sqrt
+import logging
+
+# Sensor to vehicle axes when the IMU has never been calibrated: the OBC is mounted
+# with the sensor's x axis forward, z axis to the right and y axis up
+DEFAULT_ROTATION = (16384, 0, 0,
+                    0, 0, -16384,
+                    0, 16384, 0)
+
+class Mounting:
+    # Rotation and offset turning sensor relative accelerations (mg) into vehicle relative ones:
+    # x forward, y left, z up. The rotation matrix is stored as Q14 integers so the
+    # per-sample transform is 9 integer multiply-adds, with no allocation.
+    # The vehicle axes are right-handed: gyro rates are rotated by the same matrix, and a
+    # reflection would flip them, the gravity tracked by the motion filter turning the wrong way.
+    def __init__(self, setting=None):
+        if setting:
+            self.rotation = array('i', setting['rotation'])
+            self.offset = array('i', setting['offset'])
+            if self.determinant() < 0: # Saved by an older calibration, with the lateral axis to the right
+                for i in (3, 4, 5):
+                    self.rotation[i] = -self.rotation[i]
+                logging.info("> IMU mounting made right-handed")
+        else:
+            self.rotation = array('i', DEFAULT_ROTATION)
+            self.offset = array('i', [0, 0, 0])
+
+    def transform(self, x, y, z, out):
+        r = self.rotation
+        x -= self.offset[0]
+        y -= self.offset[1]
+        z -= self.offset[2]
+        out[0] = (r[0] * x + r[1] * y + r[2] * z) >> 14
+        out[1] = (r[3] * x + r[4] * y + r[5] * z) >> 14
+        out[2] = (r[6] * x + r[7] * y + r[8] * z) >> 14
+
+    def forward(self, x, y, z):
+        # Longitudinal component only, 3 multiplications instead of 9
+        r = self.rotation
+        return (r[0] * (x - self.offset[0]) + r[1] * (y - self.offset[1]) + r[2] * (z - self.offset[2])) >> 14
+
+    def rotate(self, x, y, z, out):
+        # Rotation only, for vectors the accelerometer offset doesn't apply to (gyro rates)
+        r = self.rotation
+        out[0] = (r[0] * x + r[1] * y + r[2] * z) >> 14
+        out[1] = (r[3] * x + r[4] * y + r[5] * z) >> 14
+        out[2] = (r[6] * x + r[7] * y + r[8] * z) >> 14
+
+    def determinant(self):
+        r = self.rotation
+        return (r[0] * (r[4] * r[8] - r[5] * r[7]) - r[1] * (r[3] * r[8] - r[5] * r[6])
+                + r[2] * (r[3] * r[7] - r[4] * r[6]))
+
+    def to_setting(self):
+        return {'rotation': list(self.rotation), 'offset': list(self.offset)}
+
+
+class MountingCalibrator:
+    # Averages accelerometer samples while the car is stationary, then solves for the
+    # gravity vector: it gives the vertical axis, the previous forward axis projected on
+    # the horizontal plane gives the longitudinal one. Any movement restarts the average.
+    # on_done is called with the new setting once solved, from the motion filter's update.
+    def __init__(self, mounting, duration=600, max_deviation=30, on_done=None):
+        self.mounting = mounting
+        self.on_done = on_done
+        self.duration = duration # Samples to average, 3s at 200Hz
+        self.max_variance = max_deviation ** 2 # mg²
+        self.result = None
+        self.moving = False # Last sample restarted the calibration
+        self.restart()
+
+    def restart(self):
+        self.count = 0
+        self.mean = [0.0, 0.0, 0.0]
+        self.m2 = [0.0, 0.0, 0.0] # Welford's running sums of squared differences
+
+    @property
+    def progress(self):
+        return min(100, self.count * 100 // self.duration)
+
+    @property
+    def done(self):
+        return self.result is not None
+
+    def feed(self, x, y, z, stationary=True):
+        # Returns False and restarts when the car moves
+        if self.done:
+            return True
+        self.moving = not stationary
+        if not stationary:
+            self.restart()
+            return False
+        self.count += 1
+        for axis, value in ((0, x), (1, y), (2, z)):
+            delta = value - self.mean[axis]
+            self.mean[axis] += delta / self.count
+            self.m2[axis] += delta * (value - self.mean[axis])
+        if self.count > 20 and max(self.m2) / self.count > self.max_variance:
+            logging.debug("> IMU calibration: vibrations detected, restarting")
+            self.moving = True
+            self.restart()
+            return False
+        if self.count >= self.duration:
+            self.solve()
+        return True
+
+    def solve(self):
+        gravity = self.mean
+        norm = sqrt(sum(value * value for value in gravity))
+        if norm < 500: # Can't be gravity
+            logging.error(f"> IMU calibration failed, gravity: {gravity}")
+            self.restart()
+            return
+        up = [value / norm for value in gravity]
+        forward = [self.mounting.rotation[i] / 16384 for i in range(3)]
+        dot = sum(forward[i] * up[i] for i in range(3))
+        forward = [forward[i] - dot * up[i] for i in range(3)]
+        forward_norm = sqrt(sum(value * value for value in forward))
+        if forward_norm < 0.3: # Previous forward axis is nearly vertical, fall back on the sensor's axes
+            for hint in ((1, 0, 0), (0, 1, 0), (0, 0, 1)):
+                dot = sum(hint[i] * up[i] for i in range(3))
+                forward = [hint[i] - dot * up[i] for i in range(3)]
+                forward_norm = sqrt(sum(value * value for value in forward))
+                if forward_norm >= 0.3:
+                    break
+        forward = [value / forward_norm for value in forward]
+        lateral = [up[1] * forward[2] - up[2] * forward[1], # up x forward: to the left, right-handed axes
+                   up[2] * forward[0] - up[0] * forward[2],
+                   up[0] * forward[1] - up[1] * forward[0]]
+        rotation = [round(value * 16384) for value in forward + lateral + up]
+        offset = [round(gravity[i] - up[i] * 1000) for i in range(3)] # Accelerometer bias along gravity
+        self.mounting.rotation = array('i', rotation)
+        self.mounting.offset = array('i', offset)
+        self.result = self.mounting.to_setting()
+        logging.info(f"> IMU calibrated, gravity: {gravity}, mounting: {self.result}")
+        if self.on_done:
+            self.on_done(self.result)
@@ -0,0 +1,198 @@
+import time
+import logging
+
+ROLLOUT = 0.3048 # m, drag strip convention: timing starts once the car has moved 1ft
+
+# Speeds in km/h, distance in m. A start speed of 0 means a standing start, timed from the launch
+TARGETS = [
+    {'name': '0-60MP', 'start': 0, 'end': 96.5606},
+    {'name': '0-100', 'start': 0, 'end': 100},
+    {'name': '80-120', 'start': 80, 'end': 120},
+    {'name': '1/4MI', 'distance': 402.336},
+    {'name': '100-0', 'start': 100, 'end': 0},
+]
+
+class PerformanceMeter:
+    # Times several targets at once from the GPS fixes: between two fixes, speed is taken as
+    # linear, so threshold crossing times (and distances) are interpolated rather than rounded
+    # to a fix. Standing starts are timed from the launch the motion filter detects in the
+    # 200Hz IMU samples, optionally after the rollout distance.
+    def __init__(self, gps, motion, targets = TARGETS, rollout = False, timeout_ms = 60000):
+        self.gps = gps
+        self.motion = motion
+        self.targets = targets
+        self.rollout = rollout
+        self.timeout_ms = timeout_ms
+        self.runs = {} # Running targets, by name: {'start': ticks, 'distance': m at start, 'altitude': m at start}
+        self.results = {} # Last result of every target, by name: {'time': ms, 'distance': m, 'speed': km/h, 'climb': m}
+        self.last_result = None # Name of the last completed target
+        self.display_end_time = 0
+        self.listeners = [] # Called with (target, result) for each completed target
+        self.reset()
+
+    def reset(self):
+        self.runs = {}
+        self.launch_ticks = None
+        self.rollout_pending = False
+        self.previous = None # [ticks, km/h, m] at the last fix
+        self.stationary_ticks = None # Last fix below 1km/h, unless the car has moved since
+        self.distance = 0 # m, integrated since the meter was reset
+        self.motion.launch_armed = False
+
+    @property
+    def launched(self):
+        return self.launch_ticks is not None
+
+    def running(self, name):
+        return name in self.runs
+
+    def elapsed(self, name):
+        run = self.runs.get(name)
+        if run is None or run['start'] is None:
+            return 0
+        return max(0, time.ticks_diff(time.ticks_ms(), run['start']))
+
+    def show_result(self):
+        return time.ticks_diff(self.display_end_time, time.ticks_ms()) > 0
+
+    def update(self):
+        # Called at every loop, only works on new fixes and launches
+        gps = self.gps
+        if not gps.has_fix():
+            return
+        if not self.launched and self.motion.launch_ticks is not None:
+            self.launch(self.motion.launch_ticks)
+        if not self.launched and not self.motion.launch_armed and self.motion.speed.kmh < 1:
+            self.motion.arm_launch()
+        if self.previous is not None and gps.fix_ticks == self.previous[0]:
+            return
+        point = [gps.fix_ticks, gps.parsed.speed[2], 0]
+        if self.previous is None:
+            point[2] = self.distance
+            self.previous = point
+            return
+        if not self.launched and point[1] > 5 and self.stationary_ticks is not None: # The IMU missed the launch
+            logging.debug("> No launch detected, standing starts timed from the last stationary fix")
+            self.motion.launch_armed = False
+            self.launch(self.stationary_ticks)
+        self.segment(self.previous, point)
+        self.previous = point
+        if point[1] < 1:
+            self.stationary_ticks = point[0]
+        elif point[1] > 5:
+            self.stationary_ticks = None
+
+    def launch(self, ticks):
+        self.launch_ticks = ticks
+        self.rollout_pending = self.rollout
+        start = None if self.rollout else ticks
+        for target in self.targets:
+            if target.get('start', 0) == 0 and target.get('end', 1) > 0:
+                self.runs[target['name']] = {'start': start, 'distance': self.distance, 'altitude': self.gps.parsed.altitude}
+        if self.previous is not None and time.ticks_diff(self.previous[0], ticks) < 0 and self.previous[1] < 1:
+            self.previous = [ticks, 0, self.distance] # Standing still until the launch
+        logging.car(f"> Launch at {ticks}")
+
+    def segment(self, previous, point):
+        start_ticks, start_speed, start_distance = previous
+        duration = time.ticks_diff(point[0], start_ticks)
+        if duration <= 0:
+            point[2] = start_distance
+            return
+        speed = point[1]
+        point[2] = start_distance + (start_speed + speed) / 7.2 * duration / 1000 # km/h to m/s, averaged
+        self.distance = point[2]
+        if self.rollout_pending and point[2] - self.runs_distance() >= ROLLOUT:
+            ticks = self.distance_crossing(previous, point, self.runs_distance() + ROLLOUT - start_distance)
+            for run in self.runs.values():
+                if run['start'] is None:
+                    run['start'] = ticks
+                    run['distance'] += ROLLOUT
+            self.rollout_pending = False
+        for target in self.targets:
+            name = target['name']
+            run = self.runs.get(name)
+            if 'distance' in target:
+                if run is None or run['start'] is None:
+                    continue
+                if point[2] - run['distance'] >= target['distance']:
+                    remaining = run['distance'] + target['distance'] - start_distance
+                    ticks = self.distance_crossing(previous, point, remaining)
+                    ratio = time.ticks_diff(ticks, start_ticks) / duration
+                    self.complete(target, ticks, target['distance'], start_speed + ratio * (speed - start_speed))
+                continue
+            low, high = min(target['start'], target['end']), max(target['start'], target['end'])
+            accelerating = target['end'] > target['start']
+            if run is None:
+                if target['start'] == 0: # Standing starts begin at the launch
+                    continue
+                if (accelerating and start_speed < target['start'] <= speed) or (not accelerating and start_speed > target['start'] >= speed):
+                    ticks = self.speed_crossing(previous, point, target['start'])
+                    self.runs[name] = {'start': ticks, 'distance': self.distance_at(previous, point, ticks),
+                                       'altitude': self.gps.parsed.altitude}
+                    run = self.runs[name]
+                else:
+                    continue
+            if run['start'] is None:
+                continue
+            end = max(target['end'], 1) # GPS speed rarely reads 0 when stopped
+            if (accelerating and start_speed < end <= speed) or (not accelerating and start_speed > end >= speed):
+                ticks = self.speed_crossing(previous, point, end)
+                self.complete(target, ticks, self.distance_at(previous, point, ticks) - run['distance'], target['end'])
+            elif (accelerating and speed < low - 2) or (not accelerating and speed > high + 2):
+                del self.runs[name] # Lifted, or accelerating again while braking
+        self.check_timeouts(point[0], speed)
+
+    def runs_distance(self):
+        for run in self.runs.values():
+            if run['start'] is None:
+                return run['distance']
+        return self.distance
+
+    def check_timeouts(self, ticks, speed):
+        if self.launched and speed < 1 and time.ticks_diff(ticks, self.launch_ticks) > 2000: # False launch
+            for target in self.targets:
+                if target.get('start', 0) == 0:
+                    self.runs.pop(target['name'], None)
+        for name in list(self.runs):
+            start = self.runs[name]['start']
+            if start is not None and time.ticks_diff(ticks, start) > self.timeout_ms:
+                del self.runs[name]
+        if self.launched and not any(target.get('start', 0) == 0 and target['name'] in self.runs for target in self.targets):
+            self.launch_ticks = None # Standing start targets all done, re-armed once stopped
+            self.motion.launch_ticks = None
+
+    def speed_crossing(self, previous, point, speed):
+        ratio = (speed - previous[1]) / (point[1] - previous[1])
+        return time.ticks_add(previous[0], round(ratio * time.ticks_diff(point[0], previous[0])))
+
+    def distance_at(self, previous, point, ticks):
+        # Distance (m) reached at ticks within the segment
+        duration = time.ticks_diff(point[0], previous[0]) / 1000
+        elapsed = time.ticks_diff(ticks, previous[0]) / 1000
+        v0 = previous[1] / 3.6
+        v1 = point[1] / 3.6
+        return previous[2] + v0 * elapsed + (v1 - v0) * elapsed ** 2 / (2 * duration)
+
+    def distance_crossing(self, previous, point, distance):
+        # Speed is linear over the segment: distance(t) = v0 * t + (v1 - v0) * t² / (2 * T)
+        duration = time.ticks_diff(point[0], previous[0]) / 1000
+        v0 = previous[1] / 3.6
+        a = (point[1] / 3.6 - v0) / (2 * duration)
+        discriminant = v0 ** 2 + 4 * a * distance
+        if discriminant <= 0 or v0 + discriminant ** 0.5 <= 0:
+            return point[0]
+        elapsed = 2 * distance / (v0 + discriminant ** 0.5)
+        return time.ticks_add(previous[0], round(min(elapsed, duration) * 1000))
+
+    def complete(self, target, ticks, distance, speed):
+        name = target['name']
+        run = self.runs.pop(name)
+        result = {'time': time.ticks_diff(ticks, run['start']), 'distance': distance, 'speed': speed,
+                  'climb': self.gps.parsed.altitude - run['altitude']}
+        self.results[name] = result
+        self.last_result = name
+        self.display_end_time = time.ticks_add(time.ticks_ms(), 4000)
+        logging.car(f"> {name}: {result['time']}ms, {distance:.1f}m, {speed:.1f}km/h")
+        for listener in self.listeners:
+            listener(target, result)
@@ -0,0 +1,164 @@
+import ujson as json
+import struct
+import os
+import logging
+import time
+
+class RecordFile:
+    # Fixed-size binary records appended to a flash file: record i starts at i * size,
+    # so appending or reading any record is a single seek whatever the file size.
+    def __init__(self, file, record_format):
+        self.file = file
+        self.format = record_format
+        self.size = struct.calcsize(record_format)
+        self.buffer = bytearray(self.size)
+
+    def __len__(self):
+        try:
+            return os.stat(self.file)[6] // self.size
+        except OSError:
+            return 0
+
+    def append(self, *values):
+        struct.pack_into(self.format, self.buffer, 0, *values)
+        try:
+            with open(self.file, 'ab') as file:
+                file.write(self.buffer)
+        except OSError:
+            logging.error(f"> Unable to write {self.file}")
+            return None
+        return len(self) - 1
+
+    def read(self, index):
+        with open(self.file, 'rb') as file:
+            file.seek(index * self.size)
+            file.readinto(self.buffer)
+        return struct.unpack(self.format, self.buffer)
+
+    def records(self, start = 0):
+        # Generator, one record in memory at a time
+        try:
+            with open(self.file, 'rb') as file:
+                file.seek(start * self.size)
+                while file.readinto(self.buffer) == self.size:
+                    yield struct.unpack(self.format, self.buffer)
+        except OSError:
+            return
+
+
+class RecordIndex:
+    # JSON summary kept next to a RecordFile, loaded once and rewritten on change
+    def __init__(self, file, default):
+        self.file = file
+        try:
+            with open(file, 'r') as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = default
+
+    def save(self):
+        try:
+            with open(self.file, 'w') as f:
+                json.dump(self.data, f)
+        except OSError:
+            logging.error(f"> Unable to write {self.file}")
+
+
+class LapStore:
+    # Every completed lap: session, lap number, lap time (ms), max speed (km/h * 10) and up to
+    # MAX_SECTORS sector times (ms, 0 when not timed). The index lists the sessions and
+    # keeps the all-time best lap of every track.
+    MAX_SECTORS = 4
+    FORMAT = '<HHIH4I'
+
+    def __init__(self, file = 'laps.bin', index_file = 'laps.json'):
+        self.laps = RecordFile(file, self.FORMAT)
+        self.index = RecordIndex(index_file, {'sessions': [], 'best': {}})
+
+    def start_session(self, track, date):
+        sessions = self.index.data['sessions']
+        session = sessions[-1]['id'] + 1 if sessions else 1
+        sessions.append({'id': session, 'track': track, 'date': date, 'first': len(self.laps)})
+        self.index.save()
+        logging.car(f"> Lap session {session} started at {track}")
+        return session
+
+    def add_lap(self, session, track, lap, lap_time, sectors, max_speed):
+        sectors = (list(sectors or []) + [0] * self.MAX_SECTORS)[:self.MAX_SECTORS]
+        record = self.laps.append(session, lap, lap_time, min(65535, round(max_speed * 10)), *sectors)
+        best = self.index.data['best'].get(track)
+        if record is not None and (best is None or lap_time < best['time']):
+            self.index.data['best'][track] = {'time': lap_time, 'session': session, 'lap': lap, 'record': record}
+            self.index.save()
+            logging.car(f"> All-time best lap at {track}")
+
+    def best(self, track):
+        # {'time', 'session', 'lap', 'record'} or None
+        return self.index.data['best'].get(track)
+
+    def csv(self):
+        # Generator for the web server, so the whole history is never held in RAM
+        tracks = {}
+        for session in self.index.data['sessions']:
+            tracks[session['id']] = session['track']
+        yield 'session,track,lap,lap_time_ms,max_speed_kmh,' + ','.join(f"sector{i + 1}_ms" for i in range(self.MAX_SECTORS)) + '\n'
+        for session, lap, lap_time, max_speed, *sectors in self.laps.records():
+            yield f"{session},{tracks.get(session, '')},{lap},{lap_time},{max_speed / 10}," + ','.join(str(sector) for sector in sectors) + '\n'
+
+
+class RunStore:
+    # Every completed performance run with its conditions: date (s), target, flags, time (ms),
+    # distance (dm), speed (km/h * 10), outside temperature (°C * 10), altitude (m) and slope
+    # (% * 10), UNKNOWN when not measured. Targets are stored as their position in the index's
+    # list of names, which also keeps the all-time best run of every target.
+    FORMAT = '<IBBIHHhhh'
+    UNKNOWN = -32768
+    ROLLOUT = 1 # Flag, standing start timed after the rollout
+
+    def __init__(self, file = 'runs.bin', index_file = 'runs.json'):
+        self.runs = RecordFile(file, self.FORMAT)
+        self.index = RecordIndex(index_file, {'targets': [], 'best': {}})
+
+    def target_id(self, name):
+        targets = self.index.data['targets']
+        if name not in targets:
+            targets.append(name)
+            self.index.save()
+        return targets.index(name)
+
+    def add_run(self, target, result, temperature = None, altitude = None, slope = None, rollout = False):
+        # Returns True for a new all-time best: shortest time, or shortest distance for braking targets
+        name = target['name']
+        flags = self.ROLLOUT if rollout and target.get('start', 0) == 0 else 0
+        record = self.runs.append(int(time.time()), self.target_id(name), flags, result['time'],
+                                  min(65535, round(result['distance'] * 10)), min(65535, round(result['speed'] * 10)),
+                                  self.pack(temperature, 10), self.pack(altitude, 1), self.pack(slope, 10))
+        key = 'distance' if target.get('end', 1) == 0 else 'time'
+        best = self.index.data['best'].get(name)
+        if record is None or (best is not None and best[key] <= result[key]):
+            return False
+        self.index.data['best'][name] = {'time': result['time'], 'distance': result['distance'],
+                                         'speed': result['speed'], 'rollout': bool(flags), 'record': record}
+        self.index.save()
+        logging.car(f"> All-time best {name}")
+        return True
+
+    def pack(self, value, scale):
+        if value is None:
+            return self.UNKNOWN
+        return max(-32767, min(32767, round(value * scale)))
+
+    def best(self, name):
+        # {'time', 'distance', 'speed', 'rollout', 'record'} or None
+        return self.index.data['best'].get(name)
+
+    def csv(self):
+        # Generator for the web server, so the whole history is never held in RAM
+        targets = self.index.data['targets']
+        yield 'date,target,rollout,time_ms,distance_m,speed_kmh,outside_temperature_c,altitude_m,slope_percent\n'
+        for date, target, flags, run_time, distance, speed, temperature, altitude, slope in self.runs.records():
+            conditions = ','.join('' if value == self.UNKNOWN else str(value / scale)
+                                  for value, scale in ((temperature, 10), (altitude, 1), (slope, 10)))
+            yield (f"{'{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}'.format(*time.localtime(date)[:6])},"
+                   f"{targets[target] if target < len(targets) else ''},{flags & self.ROLLOUT},{run_time},"
+                   f"{distance / 10},{speed / 10},{conditions}\n")
@@ -0,0 +1,87 @@
+import logging
+from records import RecordIndex
+
+class TankLearner:
+    # Learns the fuel sender curve from the fuel the injectors measured. The sender's median
+    # is slowly averaged again, then the ADC codes are cut in bins: each time the level crosses
+    # a bin boundary next to the previous one crossed, the fuel used in between is the content
+    # of that bin. Averaged over many drives, the bins give the level at every boundary, up to
+    # an offset taken from the current calibration. A bin is only trusted after min_samples
+    # crossings, so a single drive with a lot of slosh doesn't bend the curve.
+    def __init__(self, file = 'tank.json', bin_width = 64, tau = 60, min_samples = 3):
+        self.store = RecordIndex(file, {})
+        bins = 4096 // bin_width
+        self.sums = self.store.data.get('sums') or [0.0] * bins # L, level change along increasing codes
+        self.counts = self.store.data.get('counts') or [0] * bins
+        self.bin_width = bin_width
+        self.weight = 1 / (tau + 1) # Fed once a second, tau in s
+        self.min_samples = min_samples
+        self.code = None # Averaged sender code
+        self.bin = None
+        self.boundary = None # Last boundary crossed, and the fuel used then
+        self.boundary_fuel = 0.0
+        self.last_fuel = 0.0
+
+    def feed(self, code, fuel_used):
+        # code: median of the sender, about once a second. fuel_used: L since the refuel
+        # Returns True when a bin was learnt
+        if self.code is None or fuel_used < self.last_fuel: # Boot or refuel, the level jumped
+            self.code = code
+            self.bin = int(code) // self.bin_width
+            self.boundary = None
+            self.last_fuel = fuel_used
+            return False
+        self.last_fuel = fuel_used
+        self.code += (code - self.code) * self.weight
+        bin = int(self.code) // self.bin_width
+        if bin == self.bin:
+            return False
+        learnt = False
+        if abs(bin - self.bin) == 1:
+            boundary = max(bin, self.bin)
+            if self.boundary is not None and abs(boundary - self.boundary) == 1: # A whole bin was crossed
+                delta = fuel_used - self.boundary_fuel
+                lower = min(boundary, self.boundary)
+                self.sums[lower] += -delta if boundary > self.boundary else delta
+                self.counts[lower] += 1
+                learnt = True
+            self.boundary = boundary
+            self.boundary_fuel = fuel_used
+        else:
+            self.boundary = None
+        self.bin = bin
+        return learnt
+
+    def fit(self, calibration):
+        # Points of a new fuel calibration, None until enough bins are learnt. The longest run of
+        # learnt bins sets the curve, offset to match the current calibration on average, which
+        # still gives the points outside of the run
+        start = length = 0
+        run_start = None
+        for bin in range(len(self.counts) + 1):
+            if bin < len(self.counts) and self.counts[bin] >= self.min_samples:
+                if run_start is None:
+                    run_start = bin
+            elif run_start is not None:
+                if bin - run_start > length:
+                    start, length = run_start, bin - run_start
+                run_start = None
+        if length < 2:
+            return None
+        codes = [start * self.bin_width]
+        levels = [0.0]
+        for bin in range(start, start + length):
+            codes.append((bin + 1) * self.bin_width)
+            levels.append(levels[-1] + self.sums[bin] / self.counts[bin])
+        offset = sum(calibration.convert(codes[i]) / 1000 - levels[i] for i in range(len(codes))) / len(codes)
+        points = [[codes[i], round(levels[i] + offset, 2)] for i in range(len(codes))]
+        for i in range(len(calibration.codes)):
+            if calibration.codes[i] < codes[0] or calibration.codes[i] > codes[-1]:
+                points.append([calibration.codes[i], calibration.values[i] / 1000])
+        logging.info(f"> Fuel sender curve learnt from {sum(self.counts[start:start + length])} crossings")
+        return sorted(points)
+
+    def save(self):
+        self.store.data['sums'] = self.sums
+        self.store.data['counts'] = self.counts
+        self.store.save()
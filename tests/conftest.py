@@ -0,0 +1,56 @@
+# The OBC runs on MicroPython: the few parts of its API the pure Python modules use are
+# provided here, so their logic can be tested under CPython. Run with `pytest tests` from
+# the repository: `python -m pytest` would import the OBC's logging.py instead of the standard one.
+import gc
+import json
+import logging
+import os
+import sys
+import time
+import types
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+class Clock:
+    # ticks_ms, set by the tests
+    now = 0
+
+CLOCK = Clock()
+time.ticks_ms = lambda: CLOCK.now
+time.ticks_us = lambda: CLOCK.now * 1000
+time.ticks_add = lambda ticks, delta: ticks + delta
+time.ticks_diff = lambda new, old: new - old
+time.sleep_ms = lambda ms: None
+gc.mem_free = lambda: 0
+
+machine = types.ModuleType('machine')
+machine.Timer = type('Timer', (), {'PERIODIC': 1, '__init__': lambda self, *args, **kwargs: None,
+                                   'init': lambda self, *args, **kwargs: None,
+                                   'deinit': lambda self: None})
+machine.Pin = type('Pin', (), {'IN': 0, 'OUT': 1, 'PULL_UP': 1, 'PULL_DOWN': 2})
+machine.mem32 = {}
+sys.modules['machine'] = machine
+
+micropython = types.ModuleType('micropython')
+micropython.schedule = lambda function, argument: function(argument)
+micropython.const = lambda value: value
+sys.modules['micropython'] = micropython
+
+sys.modules['ujson'] = json
+logging.car = logging.info # The OBC's logging has a level for the car's events
+logging.warn = logging.warning # Deprecated in the standard one
+
+
+@pytest.fixture
+def clock():
+    CLOCK.now = 0
+    return CLOCK
+
+
+@pytest.fixture
+def flash(tmp_path, monkeypatch):
+    # Files written by the modules go to a temporary directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
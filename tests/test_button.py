@@ -0,0 +1,26 @@
+from button import InputQueue, EDGE_PRESS, EDGE_RELEASE, EDGE_HOLD, EDGE_REPEAT
+
+
+def calls(events):
+    # Runs the events through a queue, returns the (long_press, repeating) of each handler call
+    inputs = InputQueue()
+    result = []
+    inputs.register(10, lambda button_id, long_press: result.append((long_press, inputs.repeating)))
+    for edge, ticks, mask in events:
+        inputs.put(10, edge, ticks, mask)
+    inputs.dispatch()
+    return result
+
+
+def test_tap():
+    assert calls([(EDGE_PRESS, 0, 0), (EDGE_RELEASE, 100, 0)]) == [(False, False)]
+
+
+def test_hold_is_one_long_press_then_repeats():
+    assert calls([(EDGE_PRESS, 0, 0), (EDGE_HOLD, 700, 0), (EDGE_REPEAT, 900, 0), (EDGE_RELEASE, 1000, 0)]) == [
+        (True, False), (True, True)]
+
+
+def test_tap_then_hold_repeats_the_tap():
+    assert calls([(EDGE_PRESS, 0, 0), (EDGE_RELEASE, 100, 0), (EDGE_PRESS, 200, 0),
+                  (EDGE_HOLD, 900, 1), (EDGE_REPEAT, 1100, 1)]) == [(False, False), (False, True), (False, True)]
@@ -0,0 +1,64 @@
+import json
+import pytest
+from calibration import Calibration, DEFAULT_TABLES, load_calibrations, compose
+
+ROUNDING = 5 # milli-units, slopes are rounded to 1/256 milli-unit per code over spans of up to 4095 codes
+
+
+def test_convert_at_breakpoints():
+    calibration = Calibration([[0, -1.29], [2048, 3], [4095, 7.255]])
+    assert calibration.convert(0) == -1290
+    assert calibration.convert(2048) == 3000
+    assert calibration.convert(4095) == pytest.approx(7255, abs = ROUNDING)
+
+
+def test_convert_interpolates():
+    calibration = Calibration([[1000, 10], [3000, 30]])
+    assert calibration.convert(1500) == pytest.approx(15000, abs = 1)
+    assert calibration.convert(2999) == pytest.approx(29990, abs = 1)
+
+
+def test_convert_extrapolates_outside_the_table():
+    calibration = Calibration([[1000, 10], [2000, 20], [3000, 40]])
+    assert calibration.convert(0) == pytest.approx(0, abs = 1)
+    assert calibration.convert(4000) == pytest.approx(60000, abs = 1)
+
+
+def test_points_are_sorted():
+    assert Calibration([[3000, 30], [1000, 10]]).convert(2000) == pytest.approx(20000, abs = 1)
+
+
+def test_default_tables_match_the_sender_formulas():
+    fuel = Calibration(DEFAULT_TABLES['fuel'])
+    volts = 2048 * 3.3 / 4096
+    assert fuel.convert(2048) / 1000 == pytest.approx(55 * volts / 0.9, abs = 0.01)
+
+
+@pytest.mark.parametrize('points', [[[0, 1]], [[0, 1], [0, 2]]])
+def test_invalid_tables(points):
+    with pytest.raises(ValueError):
+        Calibration(points)
+
+
+def test_load_keeps_the_defaults_of_invalid_tables(flash):
+    (flash / 'calibration.json').write_text(json.dumps({'fuel': [[0, 0], [4095, 60]], 'voltage': [[0, 1]]}))
+    calibrations = load_calibrations()
+    assert calibrations['fuel'].convert(4095) == pytest.approx(60000, abs = ROUNDING)
+    assert calibrations['voltage'].convert(4095) == Calibration(DEFAULT_TABLES['voltage']).convert(4095)
+    assert set(calibrations) == set(DEFAULT_TABLES)
+
+
+def test_compose_battery_voltage_to_dead_time():
+    voltage = Calibration(DEFAULT_TABLES['voltage']) # ADC code to mV
+    dead_time = Calibration(DEFAULT_TABLES['inj_deadtime']) # mV to µs
+    table = compose(dead_time, voltage)
+    assert len(table) == 256
+    code = 9000 * 4095 // 9898 # 9V
+    assert table[code >> 4] == pytest.approx(1625, abs = 10)
+    assert list(table) == sorted(table, reverse = True) # Longer at lower voltages
+
+
+def test_compose_clamps_to_16_bits():
+    table = compose(Calibration([[0, 100], [4095, -100]]), Calibration([[0, 0], [4095, 4.095]]))
+    assert table[0] == 65535
+    assert table[-1] == 0
@@ -0,0 +1,91 @@
+import math
+import pytest
+from mounting import Mounting, MountingCalibrator, DEFAULT_ROTATION
+from motion import MotionFilter
+
+
+def matrix(mounting):
+    return [[mounting.rotation[row * 3 + column] / 16384 for column in range(3)] for row in range(3)]
+
+
+def to_sensor(mounting, vector):
+    # Car axes to sensor axes, the transpose of the mounting rotation
+    r = matrix(mounting)
+    return [sum(r[row][column] * vector[row] for row in range(3)) for column in range(3)]
+
+
+def pitch(mounting, rate = 20, duration = 1.0, steps = 50):
+    # Pitches the car at `rate` °/s, the accelerometer only reading gravity, and returns the
+    # true gravity in the car's axes and the filter's longitudinal acceleration at the end
+    motion = MotionFilter(None, mounting, gravity_window = 0) # Gyro only
+    dt = duration / steps
+    omega = [0, rate * 1000, 0] # mdps, around the car's y axis
+    for step in range(steps + 1):
+        angle = math.radians(rate * step * dt)
+        gravity = [-1000 * math.sin(angle), 0, 1000 * math.cos(angle)] # Fixed in the world, g' = g x omega
+        mounting.transform(*[round(value) for value in to_sensor(mounting, gravity)], motion.accel)
+        mounting.rotate(*[round(value) for value in to_sensor(mounting, omega)], motion.rate)
+        motion.fuse(dt if step else 0)
+    return gravity, motion
+
+
+def test_default_mounting_is_a_rotation():
+    assert Mounting().determinant() == 16384 ** 3
+
+
+def test_pitch_with_default_mounting():
+    gravity, motion = pitch(Mounting())
+    assert motion.gravity == pytest.approx(gravity, abs = 5)
+    assert abs(motion.longitudinal) < 0.01
+
+
+def test_calibrated_mounting_is_a_rotation():
+    # Sensor upside down, its x axis forward: gravity reads along -z
+    mounting = Mounting()
+    calibrator = MountingCalibrator(mounting, duration = 10)
+    for _ in range(10):
+        calibrator.feed(0, 0, -1000)
+    assert calibrator.done
+    assert mounting.determinant() > 0
+    r = matrix(mounting)
+    assert r[0] == pytest.approx([1, 0, 0], abs = 0.01) # Forward
+    assert r[1] == pytest.approx([0, -1, 0], abs = 0.01) # Left
+    assert r[2] == pytest.approx([0, 0, -1], abs = 0.01) # Up
+    gravity, motion = pitch(mounting)
+    assert abs(motion.longitudinal) < 0.01
+
+
+def test_calibration_moving_restarts():
+    calibrator = MountingCalibrator(Mounting(), duration = 10)
+    for _ in range(5):
+        calibrator.feed(0, 1000, 0)
+    calibrator.feed(0, 1000, 0, stationary = False)
+    assert calibrator.moving and calibrator.count == 0
+
+
+def test_left_handed_setting_is_converted():
+    left_handed = list(DEFAULT_ROTATION)
+    left_handed[5] = -left_handed[5]
+    mounting = Mounting({'rotation': left_handed, 'offset': [0, 0, 0]})
+    assert list(mounting.rotation) == list(DEFAULT_ROTATION)
+
+
+def test_lateral_is_positive_to_the_right():
+    mounting = Mounting()
+    motion = MotionFilter(None, mounting, gravity_window = 0)
+    for step in range(50): # 0.5g to the right, gravity up
+        mounting.transform(*[round(value) for value in to_sensor(mounting, [0, -500, 1000])], motion.accel)
+        if not step:
+            motion.gravity[:] = [0.0, 0.0, 1000.0]
+            motion.initialized = True
+        motion.fuse(0.02)
+    assert motion.lateral == pytest.approx(0.5, abs = 0.01)
+
+
+def test_calibration_is_handed_over_once_solved():
+    saved = []
+    mounting = Mounting()
+    calibrator = MountingCalibrator(mounting, duration = 10, on_done = saved.append)
+    for _ in range(20):
+        calibrator.feed(0, 1000, 0)
+    assert saved == [mounting.to_setting()]
@@ -0,0 +1,103 @@
+import pytest
+from performance import PerformanceMeter, ROLLOUT
+
+LAUNCH = 1000 # ms
+ACCELERATION = 4 # m/s², up to 150km/h
+BRAKING = 9 # m/s², 3s after reaching it
+
+
+class Parsed:
+    speed = [0, 0, 0]
+    altitude = 100
+
+
+class GPS:
+    def __init__(self):
+        self.parsed = Parsed()
+        self.fix_ticks = 0
+
+    def has_fix(self):
+        return True
+
+
+class Speed:
+    kmh = 0
+
+
+class Motion:
+    def __init__(self):
+        self.launch_armed = False
+        self.launch_ticks = None
+        self.speed = Speed()
+
+    def arm_launch(self):
+        self.launch_ticks = None
+        self.launch_armed = True
+
+
+def speed_at(ms):
+    # m/s of the car at ms since power on
+    t = max(0, ms - LAUNCH) / 1000
+    top = 150 / 3.6
+    accelerating = top / ACCELERATION
+    if t < accelerating:
+        return ACCELERATION * t
+    return max(0, top - BRAKING * max(0, t - accelerating - 3))
+
+
+def reaching(distance):
+    # ms from the launch to cover distance (m), integrated every ms
+    covered = 0
+    ms = LAUNCH
+    while covered < distance:
+        ms += 1
+        covered += (speed_at(ms - 1) + speed_at(ms)) / 2000
+    return ms - LAUNCH
+
+
+def run(clock, rollout = False, imu = True):
+    # Drives the car with 10Hz GPS fixes, the IMU detecting the launch 4ms late
+    gps = GPS()
+    motion = Motion()
+    meter = PerformanceMeter(gps, motion, rollout = rollout)
+    for ms in range(1, 30000):
+        clock.now = ms
+        if imu and ms == LAUNCH + 4 and motion.launch_armed:
+            motion.launch_ticks = ms
+            motion.launch_armed = False
+        motion.speed.kmh = speed_at(ms) * 3.6
+        if ms % 100 == 0:
+            gps.fix_ticks = ms
+            gps.parsed.speed = [0, 0, speed_at(ms) * 3.6]
+        meter.update()
+    return meter.results
+
+
+def test_standing_and_rolling_starts(clock):
+    results = run(clock)
+    assert results['0-100']['time'] == pytest.approx(100 / 3.6 / ACCELERATION * 1000 - 4, abs = 5) # Launch seen 4ms late
+    assert results['80-120']['time'] == pytest.approx(40 / 3.6 / ACCELERATION * 1000, abs = 5)
+    assert results['0-100']['distance'] == pytest.approx((100 / 3.6) ** 2 / (2 * ACCELERATION), abs = 1)
+
+
+def test_quarter_mile(clock):
+    results = run(clock)
+    assert results['1/4MI']['time'] == pytest.approx(reaching(402.336) - 4, abs = 10)
+    assert results['1/4MI']['speed'] == pytest.approx(speed_at(LAUNCH + reaching(402.336)) * 3.6, abs = 0.5)
+
+
+def test_braking_distance(clock):
+    results = run(clock)
+    assert results['100-0']['distance'] == pytest.approx(((100 / 3.6) ** 2 - (1 / 3.6) ** 2) / (2 * BRAKING), abs = 0.1)
+    # Timed down to 1km/h, the last fix before stopping is sampled after the car stopped
+    assert results['100-0']['time'] == pytest.approx(99 / 3.6 / BRAKING * 1000, abs = 20)
+
+
+def test_rollout_starts_the_clock_a_foot_later(clock):
+    rollout = (2 * ROLLOUT / ACCELERATION) ** 0.5 * 1000
+    assert run(clock, rollout = True)['0-100']['time'] == pytest.approx(100 / 3.6 / ACCELERATION * 1000 - rollout, abs = 5)
+
+
+def test_launch_missed_by_the_imu(clock):
+    # Timed from the last stationary fix instead
+    assert run(clock, imu = False)['0-100']['time'] == pytest.approx(100 / 3.6 / ACCELERATION * 1000, abs = 5)
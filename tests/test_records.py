@@ -0,0 +1,56 @@
+import time
+from records import RecordFile, LapStore, RunStore
+
+
+def test_record_file_round_trip(flash):
+    records = RecordFile('test.bin', '<HI')
+    assert len(records) == 0
+    assert records.append(1, 70000) == 0
+    assert records.append(2, 80000) == 1
+    assert len(records) == 2
+    assert records.read(1) == (2, 80000)
+    assert list(records.records()) == [(1, 70000), (2, 80000)]
+    assert list(records.records(1)) == [(2, 80000)]
+
+
+def test_missing_record_file(flash):
+    assert list(RecordFile('missing.bin', '<HI').records()) == []
+
+
+def test_laps_and_best_survive_a_reboot(flash):
+    store = LapStore()
+    session = store.start_session('SPA', '2024-06-01')
+    store.add_lap(session, 'SPA', 1, 140500, [40000, 50000, 50500], 251.3)
+    store.add_lap(session, 'SPA', 2, 139000, None, 255)
+    store.add_lap(session, 'SPA', 3, 141000, None, 250)
+    store = LapStore()
+    assert store.start_session('SPA', '2024-06-02') == session + 1
+    assert store.best('SPA') == {'time': 139000, 'session': session, 'lap': 2, 'record': 1}
+    assert store.best('ZOLDER') is None
+    assert list(store.laps.records())[0] == (session, 1, 140500, 2513, 40000, 50000, 50500, 0)
+
+
+def test_laps_csv(flash):
+    store = LapStore()
+    session = store.start_session('SPA', '2024-06-01')
+    store.add_lap(session, 'SPA', 1, 140500, [40000], 251.3)
+    lines = list(store.csv())
+    assert lines[0].startswith('session,track,lap,lap_time_ms,max_speed_kmh,sector1_ms')
+    assert lines[1] == f"{session},SPA,1,140500,251.3,40000,0,0,0\n"
+
+
+def test_runs_best_and_csv(flash, monkeypatch):
+    monkeypatch.setattr(time, 'time', lambda: 1717200000.5)
+    store = RunStore()
+    accelerating = {'name': '0-100', 'start': 0, 'end': 100}
+    braking = {'name': '100-0', 'start': 100, 'end': 0}
+    assert store.add_run(accelerating, {'time': 7100, 'distance': 98.6, 'speed': 100}, 21.5, 120, None, rollout = True)
+    assert not store.add_run(accelerating, {'time': 7300, 'distance': 101.2, 'speed': 100})
+    assert store.add_run(braking, {'time': 3100, 'distance': 38.2, 'speed': 0})
+    assert store.add_run(braking, {'time': 3300, 'distance': 37.9, 'speed': 0}) # Shorter, though longer to stop
+    store = RunStore()
+    assert store.best('0-100') == {'time': 7100, 'distance': 98.6, 'speed': 100, 'rollout': True, 'record': 0}
+    assert store.best('100-0')['distance'] == 37.9
+    lines = list(store.csv())
+    assert lines[1].split(',')[1:] == ['0-100', '1', '7100', '98.6', '100.0', '21.5', '120.0', '\n']
+    assert lines[2].split(',')[-3:] == ['', '', '\n']
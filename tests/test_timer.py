@@ -0,0 +1,134 @@
+import math
+import pytest
+from timer import LapTimer, signed_position
+
+HEMISPHERES = [(1, 1), (1, -1), (-1, 1), (-1, -1)] # Signs of the latitude and longitude
+COURSES = [0, 45, 90, 180, 270]
+
+
+class Parsed:
+    # The MicropyGPS attributes the lap timer reads, coordinates as magnitude and hemisphere
+    def __init__(self, course):
+        self.course = course
+        self.speed = [0, 0, 100]
+        self.latitude = [0, 'N']
+        self.longitude = [0, 'E']
+
+    def place(self, latitude, longitude):
+        self.latitude = [abs(latitude), 'S' if latitude < 0 else 'N']
+        self.longitude = [abs(longitude), 'W' if longitude < 0 else 'E']
+
+
+class GPS:
+    def __init__(self, origin, course):
+        self.origin = origin # Signed degrees of the start/finish line
+        self.parsed = Parsed(course)
+        self.fix_ticks = None
+
+    def has_fix(self):
+        return True
+
+    def fix(self, clock, ticks, east, north):
+        # Moves the car to east, north (m) from the line
+        latitude = self.origin[0] + north / 111320
+        longitude = self.origin[1] + east / (111320 * math.cos(math.radians(self.origin[0])))
+        self.parsed.place(latitude, longitude)
+        self.fix_ticks = clock.now = ticks
+
+
+def along(course, distance):
+    # East and north of a point `distance` m along the course
+    return distance * math.sin(math.radians(course)), distance * math.cos(math.radians(course))
+
+
+def drive(clock, laptimer, gps, course, points):
+    # points: (ticks, distance along the course)
+    for ticks, distance in points:
+        gps.fix(clock, ticks, *along(course, distance))
+        laptimer.update(gps)
+
+
+def test_signed_position():
+    parsed = Parsed(0)
+    parsed.place(-33.9, -70.6)
+    assert signed_position(parsed) == (-33.9, -70.6)
+    parsed.place(50.3, 6.9)
+    assert signed_position(parsed) == (50.3, 6.9)
+
+
+@pytest.mark.parametrize('signs', HEMISPHERES)
+@pytest.mark.parametrize('course', COURSES)
+def test_lap_in_every_hemisphere(clock, signs, course):
+    laptimer = LapTimer()
+    laptimer.start()
+    gps = GPS((signs[0] * 48.3, signs[1] * 11.6), course)
+    # Line set at 0m, out 200m, back behind the line and across it 30s later, halfway between two fixes
+    drive(clock, laptimer, gps, course, [(0, 0), (10000, 100), (20000, 200), (29000, -50), (31000, 50)])
+    assert laptimer.number_of_lap == 2
+    assert laptimer.lap_time == 30000
+
+
+@pytest.mark.parametrize('signs', HEMISPHERES)
+def test_crossing_backwards_is_not_a_lap(clock, signs):
+    laptimer = LapTimer()
+    laptimer.start()
+    gps = GPS((signs[0] * 48.3, signs[1] * 11.6), 90)
+    drive(clock, laptimer, gps, 90, [(0, 0), (10000, 100), (20000, 200), (29000, 50), (31000, -50)])
+    assert laptimer.number_of_lap == 1
+
+
+def test_crossing_beside_the_gate_is_not_a_lap(clock):
+    laptimer = LapTimer(gate_width = 30)
+    laptimer.start()
+    gps = GPS((48.3, -11.6), 0)
+    for ticks, east, north in [(0, 0, 0), (10000, 0, 100), (29000, 20, -50), (31000, 20, 50)]:
+        gps.fix(clock, ticks, east, north)
+        laptimer.update(gps)
+    assert laptimer.number_of_lap == 1
+
+
+def test_jitter_around_the_line_is_ignored(clock):
+    laptimer = LapTimer()
+    laptimer.start()
+    gps = GPS((-34.8, 138.6), 180)
+    drive(clock, laptimer, gps, 180, [(0, 0), (1000, -5), (2000, 5)])
+    assert laptimer.number_of_lap == 1
+
+
+def test_gate_crossing_interpolates_the_time():
+    laptimer = LapTimer()
+    laptimer.gate_direction = [1, 0] # Heading east
+    assert laptimer.gate_crossing([-30, 0], 1000, [10, 0], 2000) == 1750
+    assert laptimer.gate_crossing([10, 0], 1000, [-30, 0], 2000) is None
+    assert laptimer.gate_crossing([-30, 0], 1000, [-10, 0], 2000) is None
+
+
+def test_parse_time():
+    laptimer = LapTimer()
+    assert laptimer.parse_time(83456) == "  1.23.4"
+    assert laptimer.parse_time(9800, '+') == "   +9.8"
+
+
+@pytest.mark.parametrize('signs', HEMISPHERES)
+def test_sector_split_in_every_hemisphere(clock, signs):
+    laptimer = LapTimer()
+    laptimer.start()
+    course = 270
+    gps = GPS((signs[0] * 48.3, signs[1] * 11.6), course)
+    drive(clock, laptimer, gps, course, [(0, 0), (5000, 100)])
+    laptimer.add_sector(gps.parsed) # Gate at 100m, timed from the next lap
+    drive(clock, laptimer, gps, course, [(10000, 200), (29000, -50), (31000, 50), (40000, 80), (42000, 120)])
+    assert laptimer.split == [1, 11000, None]
+    assert laptimer.next_sector == 1
+
+
+def test_arming_keeps_a_finished_session(clock):
+    laptimer = LapTimer()
+    assert laptimer.idle
+    laptimer.start()
+    gps = GPS((50.3, -6.9), 0)
+    drive(clock, laptimer, gps, 0, [(0, 0), (10000, 100), (20000, 200), (29000, -50), (31000, 50)])
+    laptimer.end()
+    assert not laptimer.idle # Its laps are still shown
+    laptimer.reset_laptimer()
+    assert laptimer.idle
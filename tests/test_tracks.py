@@ -0,0 +1,48 @@
+import json
+from tracks import TrackDatabase
+
+TRACKS = [
+    {'name': 'GOODWOOD', 'start': {'latitude': 50.8594, 'longitude': -0.7593, 'course': 0}, 'sectors': []},
+    {'name': 'SPA', 'start': {'latitude': 50.4372, 'longitude': 5.9714, 'course': 150}, 'sectors': []},
+    {'name': 'INTERLAGOS', 'start': {'latitude': -23.7036, 'longitude': -46.6997, 'course': 90}, 'sectors': []},
+    {'name': 'GREENWICH', 'start': {'latitude': 51.4779, 'longitude': 0.0005, 'course': 0}, 'sectors': []},
+]
+
+
+def database(flash, tracks = TRACKS):
+    (flash / 'tracks.json').write_text(json.dumps(tracks))
+    return TrackDatabase()
+
+
+def test_find_in_every_hemisphere(flash):
+    tracks = database(flash)
+    assert tracks.find(50.8590, -0.7590)['name'] == 'GOODWOOD'
+    assert tracks.find(50.4375, 5.9710)['name'] == 'SPA'
+    assert tracks.find(-23.7030, -46.7000)['name'] == 'INTERLAGOS'
+
+
+def test_find_across_cells(flash):
+    tracks = database(flash)
+    # Start lines in the neighbouring cell, across the prime meridian or a cell boundary
+    assert tracks.find(51.4779, -0.0005)['name'] == 'GREENWICH'
+    assert tracks.find(-23.6995, -46.6997)['name'] == 'INTERLAGOS'
+
+
+def test_find_outside_radius(flash):
+    tracks = database(flash)
+    assert tracks.find(50.8594, 0.7593) is None # Goodwood mirrored east
+    assert tracks.find(50.8594, -0.7593 + 0.02, radius = 1000) is None # 1.4km away
+    assert tracks.find(50.8594, -0.7593 + 0.02, radius = 2000)['name'] == 'GOODWOOD'
+
+
+def test_missing_file(flash):
+    assert TrackDatabase().find(50.8594, -0.7593) is None
+
+
+def test_add_is_saved(flash):
+    tracks = database(flash, [])
+    gate = {'latitude': -37.8497, 'longitude': 144.968, 'course': 200}
+    tracks.add(-37.8497, 144.968, 200, sectors = [gate])
+    found = TrackDatabase().find(-37.8497, 144.968)
+    assert found['name'] == 'TRACK1'
+    assert found['sectors'] == [gate]
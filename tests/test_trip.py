@@ -0,0 +1,65 @@
+import pytest
+from trip import TripComputer
+
+
+def drive(clock, trips, seconds, fuel_per_hour, speed_kmh, step = 20):
+    for _ in range(seconds * 1000 // step):
+        clock.now += step
+        trips.update(fuel_per_hour, speed_kmh)
+
+
+def test_integration(clock, flash):
+    trips = TripComputer()
+    trips.update(0, 0)
+    drive(clock, trips, 3600, 8, 100)
+    trips.fold()
+    assert trips.trips['A'] == pytest.approx([8, 100, 3600], rel = 1e-3)
+    assert trips.consumption('A') == pytest.approx(8, rel = 1e-3)
+
+
+def test_blocked_loop_is_clamped(clock, flash):
+    trips = TripComputer(max_step_ms = 5000)
+    trips.update(36, 36)
+    clock.now += 2000 # Settings menu
+    trips.update(36, 36)
+    clock.now += 60000
+    trips.update(36, 36)
+    trips.fold()
+    assert trips.trips['B'] == pytest.approx([0.07, 0.07, 7])
+
+
+def test_power_off_gap_is_skipped(clock, flash):
+    trips = TripComputer()
+    trips.update(36, 36)
+    clock.now += 1000
+    trips.update(36, 36)
+    trips.pause()
+    clock.now += 3000
+    trips.update(36, 36)
+    trips.fold()
+    assert trips.trips['A'] == pytest.approx([0.01, 0.01, 1])
+    assert TripComputer().trips['A'] == pytest.approx([0.01, 0.01, 1]) # Saved
+
+
+def test_refuel_resets_only_its_trip(clock, flash):
+    trips = TripComputer(refuel_threshold = 5)
+    trips.update(0, 0)
+    drive(clock, trips, 60, 10, 100)
+    trips.check_refuel(20, True)
+    trips.check_refuel(40, False) # Sloshing while driving
+    assert trips.trips['REFUEL'][1] > 0
+    trips.check_refuel(24, True) # Parked on a slope
+    assert trips.trips['REFUEL'][1] > 0
+    trips.check_refuel(55, True)
+    assert trips.trips['REFUEL'] == [0.0, 0.0, 0.0]
+    assert trips.trips['A'][1] == pytest.approx(100 / 60, rel = 1e-3)
+    assert trips.tank_low == 55
+
+
+def test_range(clock, flash):
+    trips = TripComputer()
+    assert trips.range(40) is None
+    trips.trips['A'] = [4.0, 50.0, 3600.0]
+    assert trips.range(40) == pytest.approx(500) # Too little driven since the refuel, longest trip
+    trips.trips['REFUEL'] = [2.5, 25.0, 1800.0]
+    assert trips.range(40) == pytest.approx(400)
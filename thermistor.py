@@ -0,0 +1,56 @@
+from array import array
+from math import log
+import struct
+import logging
+
+class Thermistor:
+    # Steinhart-Hart conversion precomputed for every MCP3208 code, so converting a raw
+    # sample is a single indexed load. The table holds deci-degrees Celsius and is cached
+    # in a binary file along with the coefficients it was generated from.
+    NO_DATA = -511 # Value of the 222K fallback used when the resistance can't be computed
+
+    def __init__(self, name, A, B, C, resistance_function, ref_voltage=3.3, resolution=4096):
+        self.file = f"thermistor_{name}.bin"
+        self.header = struct.pack('<3f', A, B, C)
+        self.table = array('h', (0 for _ in range(resolution)))
+        if not self.load():
+            logging.info(f"> Building {name} thermistor table")
+            for code in range(resolution):
+                voltage = ref_voltage * code / resolution
+                self.table[code] = self.compute(A, B, C, resistance_function, voltage)
+            self.save()
+
+    def compute(self, A, B, C, resistance_function, voltage):
+        try:
+            RNTC = resistance_function(voltage)
+        except ZeroDivisionError: #TODO: No sensor detection
+            RNTC = 10000
+        try:
+            temperature = 1 /( A + B * log(RNTC) + C *(log(RNTC))**3)
+        except (ValueError, ZeroDivisionError):
+            return self.NO_DATA
+        deci_celsius = round((temperature - 273.15) * 10)
+        return max(-32768, min(32767, deci_celsius))
+
+    def load(self):
+        try:
+            with open(self.file, 'rb') as file:
+                if file.read(len(self.header)) != self.header: # Coefficients changed
+                    return False
+                return file.readinto(self.table) == len(self.table) * 2
+        except OSError:
+            return False
+
+    def save(self):
+        try:
+            with open(self.file, 'wb') as file:
+                file.write(self.header)
+                file.write(self.table)
+        except OSError:
+            logging.error(f"> Unable to save {self.file}")
+
+    def deci_celsius(self, code):
+        return self.table[code]
+
+    def celsius(self, code):
+        return self.table[code] / 10
@@ -1,6 +1,14 @@
 import time
 import math
 import logging
+from array import array
+
+def signed_position(gps_data):
+    # MicropyGPS gives each coordinate's magnitude and its hemisphere apart:
+    # decimal degrees, negative in the southern and western hemispheres
+    latitude, longitude = gps_data.latitude, gps_data.longitude
+    return (-latitude[0] if latitude[1] == 'S' else latitude[0],
+            -longitude[0] if longitude[1] == 'W' else longitude[0])
 
 class Timer_:
     def __init__(self):
@@ -76,20 +84,178 @@ class Timer_:
         return timer_str
             
     
+class LapTrace:
+    # One lap sampled every `spacing` meters: local position (m), distance along the lap (dm)
+    # and elapsed time (ms). Arrays are allocated once; when they are full, every other
+    # sample is dropped and the spacing doubled, so laps of any length fit in the same memory.
+    def __init__(self, size = 1000, spacing = 5):
+        self.size = size
+        self.initial_spacing = spacing
+        self.x = array('h', [0] * size)
+        self.y = array('h', [0] * size)
+        self.distance = array('i', [0] * size)
+        self.elapsed = array('i', [0] * size)
+        self.clear()
+
+    def clear(self):
+        self.length = 0
+        self.spacing = self.initial_spacing * 10 # dm
+
+    def add(self, x, y, distance, elapsed):
+        # distance in m, only kept if far enough from the previous sample
+        distance = round(distance * 10)
+        if self.length and distance - self.distance[self.length - 1] < self.spacing:
+            return
+        if self.length == self.size:
+            self.decimate()
+        i = self.length
+        self.x[i] = max(-32768, min(32767, round(x)))
+        self.y[i] = max(-32768, min(32767, round(y)))
+        self.distance[i] = distance
+        self.elapsed[i] = elapsed
+        self.length += 1
+
+    def decimate(self):
+        for i in range(self.size // 2):
+            self.x[i] = self.x[2 * i]
+            self.y[i] = self.y[2 * i]
+            self.distance[i] = self.distance[2 * i]
+            self.elapsed[i] = self.elapsed[2 * i]
+        self.length = self.size // 2
+        self.spacing *= 2
+
+
 class LapTimer(Timer_):
-    def __init__(self):
+    # Laps are timed when the car crosses a virtual finish line: a gate through the start
+    # position, perpendicular to the start heading. The crossing is searched between two
+    # consecutive fixes and its time interpolated between their measurement times.
+    # Each lap is recorded as a LapTrace; the fastest one is the reference the live delta is
+    # computed against, searching the current position only around the previous match.
+    # With a TrackDatabase, known start/finish gates are used, and the timer can be armed on
+    # arrival at a track: it then starts by itself when the car first crosses the line. A line
+    # set by hand is only added to the database on request (save_track).
+    # Sector gates split each lap: only the next expected gate is tested at each fix.
+    # With a LapStore, every completed lap is saved to flash.
+    def __init__(self, gate_width = 30, tracks = None, store = None):
         Timer_.__init__(self)
+        self.tracks = tracks
+        self.store = store
+        self.session = None # LapStore session id, given at the first completed lap
+        self.lap_max_speed = 0 # km/h
+        self.track = None
+        self.armed = False
         self.start_position = None
-        self.previous_update = {'distance':0,'timestamp':None}
+        self.gate_width = gate_width # m
+        self.gate_direction = [0, 1] # Unit vector of the start heading, in local coordinates
+        self.previous_update = {'position':None,'timestamp':None}
         self.number_of_lap = 1
         self.display_delay = 0
         self.display_laps = 0
         self.fastest_lap = None
         self.delay = 0
-            
+        self.trace = LapTrace() # Current lap
+        self.best_trace = LapTrace() # Fastest lap
+        self.lap_distance = 0 # m
+        self.reference_index = 0 # Sample of best_trace matched by the last fix
+        self.live_delta = None # ms, positive when slower than the fastest lap
+        self.sectors = [] # Sector gates as {'latitude', 'longitude', 'course'}, in lap order
+        self.sector_gates = [] # The same, [x, y, direction x, direction y] in local coordinates
+        self.next_sector = 0 # Index of the only gate tested
+        self.sector_start = None # ticks
+        self.sector_times = [] # ms, current lap
+        self.best_sectors = [] # ms, one per sector (gates + 1), None until timed
+        self.split = None # [sector number, sector time, delta with the best one or None]
+        self.display_split = 0
+
     def set_start_position(self,gps_data):
-        self.start_position = {'latitude':gps_data.latitude[0],'longitude':gps_data.longitude[0],'course':gps_data.course,'timestamp':gps_data.timestamp}
+        latitude, longitude = signed_position(gps_data)
+        course = gps_data.course
+        if self.tracks:
+            track = self.tracks.find(latitude, longitude)
+            if track is not None: # Its line may be far from here, the first lap starts on it
+                self.arm(track)
+                return
+        self.set_gate({'latitude':latitude,'longitude':longitude,'course':course})
+
+    def save_track(self):
+        # Remembers the start/finish line set by hand and its sectors, so the timer arms itself there next time
+        if self.track or not self.tracks or self.start_position is None:
+            return
+        self.track = self.tracks.add(self.start_position['latitude'], self.start_position['longitude'],
+                                     self.start_position['course'], sectors = self.sectors)
+
+    def set_gate(self, gate):
+        self.start_position = {'latitude':gate['latitude'],'longitude':gate['longitude'],'course':gate['course']}
+        self.gate_direction = [math.sin(math.radians(gate['course'])), math.cos(math.radians(gate['course']))]
         logging.car(f"> Starting position: {self.start_position}")
+        self.sectors = self.track['sectors'] if self.track else [] # Gates as stored in the track database
+        self.sector_gates = []
+        for sector in self.sectors:
+            self.sector_gates.append(self.local_gate(sector))
+        self.best_sectors = [None] * (len(self.sector_gates) + 1)
+
+    def local_gate(self, gate):
+        x, y = self.convert_to_local_coordinates(gate['latitude'], gate['longitude'])
+        return [x, y, math.sin(math.radians(gate['course'])), math.cos(math.radians(gate['course']))]
+
+    def add_sector(self, gps_data):
+        # Sector gate at the current position, inserted as the gate the car just passed.
+        # Sector times are meaningless until the next lap starts.
+        latitude, longitude = signed_position(gps_data)
+        gate = {'latitude':latitude,'longitude':longitude,'course':gps_data.course}
+        self.sector_gates.insert(self.next_sector, self.local_gate(gate))
+        self.sectors.insert(self.next_sector, gate)
+        if self.track and self.tracks:
+            self.tracks.save()
+        self.next_sector += 1
+        self.best_sectors = [None] * (len(self.sector_gates) + 1)
+        self.sector_times = None
+        logging.car(f"> Sector {self.next_sector} gate added")
+
+    def complete_sector(self, crossing_time):
+        sector_time = time.ticks_diff(crossing_time, self.sector_start)
+        self.sector_start = crossing_time
+        number = len(self.sector_times) if self.sector_times is not None else None
+        if number is None or number >= len(self.best_sectors): # Gates changed during this lap
+            return
+        self.sector_times.append(sector_time)
+        best = self.best_sectors[number]
+        self.split = [number + 1, sector_time, None if best is None else sector_time - best]
+        self.display_split = time.ticks_add(crossing_time, 3000)
+        if best is None or sector_time < best:
+            self.best_sectors[number] = sector_time
+
+    @property
+    def theoretical_best(self):
+        # Sum of the best sector times, None until each one is timed
+        if None in self.best_sectors:
+            return None
+        return sum(self.best_sectors)
+
+    def show_split(self):
+        now = time.ticks_ms()
+        if self.display_split > now:
+            return True
+        else:
+            return False
+
+    def start_sectors(self, start_time):
+        self.next_sector = 0
+        self.sector_start = start_time
+        self.sector_times = []
+
+    @property
+    def idle(self):
+        # Nothing timed since the last reset: arming can't wipe any lap
+        return not self.is_running and not self.armed and self.fastest_lap is None
+
+    def arm(self, track):
+        # Waits for the first crossing of the track's start/finish line to start
+        self.reset_laptimer()
+        self.track = track
+        self.set_gate(track['start'])
+        self.armed = True
+        logging.car(f"> Lap timer armed at {track['name']}")
         
     def convert_to_local_coordinates(self, latitude, longitude):
         delta_latitude = latitude - self.start_position['latitude']
@@ -120,9 +286,13 @@ class LapTimer(Timer_):
             return False
         
         
-    def has_completed_lap(self):
-        finish_time = self.previous_update['timestamp']
+    def has_completed_lap(self, finish_time):
         logging.car(f"> Lap completed at {finish_time}.")
+        if len(self.sector_gates) and self.next_sector == len(self.sector_gates): # Last sector, unless a gate was missed
+            self.complete_sector(finish_time)
+            self.display_split = 0 # The lap time is shown instead
+            if self.theoretical_best is not None:
+                logging.car(f"> Sectors: {self.sector_times}, theoretical best: {self.parse_time(self.theoretical_best)}")
         if self.number_of_lap == 1:
             self.lap_time = time.ticks_diff(finish_time, self.start_time)
             self.fastest_lap = [self.lap_time,1]
@@ -132,10 +302,27 @@ class LapTimer(Timer_):
             self.delay = time.ticks_diff(self.lap_time,self.fastest_lap[0]) 
             if self.lap_time < self.fastest_lap[0]:
                 self.fastest_lap = [self.lap_time,self.number_of_lap]
+        if self.store:
+            self.save_lap()
+        self.lap_max_speed = 0
+        self.start_sectors(finish_time)
+        if self.fastest_lap[1] == self.number_of_lap: # This lap becomes the reference
+            self.trace, self.best_trace = self.best_trace, self.trace
+        self.trace.clear()
+        self.lap_distance = 0
+        self.reference_index = 0
+        self.live_delta = None
         self.lap_start = finish_time
         self.number_of_lap += 1
         self.display_end_time = time.ticks_add(finish_time, 3000)
     
+    def save_lap(self):
+        track = self.track['name'] if self.track else ''
+        if self.session is None:
+            self.session = self.store.start_session(track, "{:04d}-{:02d}-{:02d}".format(*time.localtime()[:3]))
+        sectors = self.sector_times if self.sector_times and len(self.sector_times) == len(self.best_sectors) else None
+        self.store.add_lap(self.session, track, self.number_of_lap, self.lap_time, sectors, self.lap_max_speed)
+
     def get_elapsed_lap_time(self):
         if self.is_running and self.number_of_lap > 1:
             return time.ticks_diff(time.ticks_ms(), self.lap_start)
@@ -144,37 +331,117 @@ class LapTimer(Timer_):
         else:
             return self.elapsed_time        
         
-    def check_for_completed_lap(self,gps_data):
-        def get_heading_delta():
-            delta = gps_data.course - self.start_position['course']
-            abs_delta = abs(delta)
-
-            if abs_delta == 180:
-                return abs_delta
-            elif abs_delta < 180:
-                return delta
-            elif gps_data.course > self.start_position['course']:
-                return abs_delta - 360
-            else:
-                return 360 - abs_delta
-            
-        current_coords = self.convert_to_local_coordinates(gps_data.latitude[0], gps_data.longitude[0])
-        distance = (current_coords[0]**2+current_coords[1]**2)**0.5
-        can_check = False
-        if self.number_of_lap == 1 and time.ticks_diff(time.ticks_ms(),self.start_time)>10000:
-            can_check = True
-        elif self.number_of_lap > 1 and time.ticks_diff(time.ticks_ms(),self.lap_start)>10000:
-            can_check = True
-        if can_check and distance < 10:
-            distance_delta = distance - self.previous_update['distance']
-            if (distance_delta > 0) and self.previous_update['distance'] != 0 and get_heading_delta() <= 30:
-                self.previous_update['distance'] = 0
-                self.has_completed_lap()
-            else:
-                self.previous_update['distance'] = distance
-                self.previous_update['timestamp'] = time.ticks_ms()
-            
-            
+    def update(self, gps):
+        # Called at every loop while running, does nothing until a new fix is available
+        if not gps.has_fix() or gps.fix_ticks == self.previous_update['timestamp']:
+            return
+        if self.start_position is None:
+            self.set_start_position(gps.parsed)
+            if not self.armed:
+                self.start_sectors(self.start_time)
+        self.check_for_completed_lap(gps)
+
+    def check_for_completed_lap(self, gps):
+        position = self.convert_to_local_coordinates(*signed_position(gps.parsed))
+        previous_position = self.previous_update['position']
+        previous_time = self.previous_update['timestamp']
+        self.previous_update['position'] = position
+        self.previous_update['timestamp'] = gps.fix_ticks
+        self.lap_max_speed = max(self.lap_max_speed, gps.parsed.speed[2])
+        if self.armed:
+            crossing_time = None if previous_position is None else self.gate_crossing(previous_position, previous_time, position, gps.fix_ticks)
+            if crossing_time is not None: # The first lap starts on the line
+                self.armed = False
+                self.is_running = True
+                self.start_time = crossing_time
+                self.start_sectors(crossing_time)
+                self.trace.add(0, 0, 0, 0)
+            return
+        if previous_position is None:
+            self.trace.add(position[0], position[1], 0, self.get_lap_elapsed(gps.fix_ticks))
+            return
+        if self.next_sector < len(self.sector_gates):
+            sector_time = self.gate_crossing(previous_position, previous_time, position, gps.fix_ticks, self.sector_gates[self.next_sector])
+            if sector_time is not None:
+                self.next_sector += 1
+                self.complete_sector(sector_time)
+        crossing_time = self.gate_crossing(previous_position, previous_time, position, gps.fix_ticks)
+        lap_start = self.start_time if self.number_of_lap == 1 else self.lap_start
+        # Ignores the GPS jitter around the line
+        if crossing_time is not None and time.ticks_diff(crossing_time, lap_start) > 10000:
+            self.has_completed_lap(crossing_time)
+            self.trace.add(0, 0, 0, 0) # The new lap starts on the line
+            self.lap_distance = (position[0] ** 2 + position[1] ** 2) ** 0.5
+        else:
+            self.lap_distance += ((position[0] - previous_position[0]) ** 2 + (position[1] - previous_position[1]) ** 2) ** 0.5
+        elapsed = self.get_lap_elapsed(gps.fix_ticks)
+        self.trace.add(position[0], position[1], self.lap_distance, elapsed)
+        self.live_delta = self.compare_to_best(position, elapsed)
+
+    def get_lap_elapsed(self, timestamp):
+        return time.ticks_diff(timestamp, self.start_time if self.number_of_lap == 1 else self.lap_start)
+
+    def compare_to_best(self, position, elapsed, window = 10, max_gap = 30):
+        # Elapsed time minus the fastest lap's at the same place, None if off its trace.
+        # Only `window` samples after the previous match are searched, the whole trace when lost.
+        best = self.best_trace
+        if best.length < 2:
+            return None
+        x, y = position
+        nearest = self.nearest_sample(x, y, max(0, self.reference_index - 2), min(best.length, self.reference_index + window))
+        if (best.x[nearest] - x) ** 2 + (best.y[nearest] - y) ** 2 > max_gap ** 2:
+            nearest = self.nearest_sample(x, y, 0, best.length)
+            if (best.x[nearest] - x) ** 2 + (best.y[nearest] - y) ** 2 > max_gap ** 2:
+                return None
+        self.reference_index = nearest
+        i = min(nearest, best.length - 2)
+        segment_x = best.x[i + 1] - best.x[i]
+        segment_y = best.y[i + 1] - best.y[i]
+        projection = (x - best.x[i]) * segment_x + (y - best.y[i]) * segment_y
+        if projection < 0 and i > 0: # Before the nearest sample, interpolates on the previous segment
+            i -= 1
+            segment_x = best.x[i + 1] - best.x[i]
+            segment_y = best.y[i + 1] - best.y[i]
+            projection = (x - best.x[i]) * segment_x + (y - best.y[i]) * segment_y
+        length = segment_x ** 2 + segment_y ** 2
+        ratio = max(0, min(1, projection / length)) if length else 0
+        reference = best.elapsed[i] + ratio * (best.elapsed[i + 1] - best.elapsed[i])
+        return round(elapsed - reference)
+
+    def nearest_sample(self, x, y, start, end):
+        best = self.best_trace
+        nearest = start
+        nearest_distance = None
+        for i in range(start, end):
+            distance = (best.x[i] - x) ** 2 + (best.y[i] - y) ** 2
+            if nearest_distance is None or distance < nearest_distance:
+                nearest = i
+                nearest_distance = distance
+        return nearest
+
+    def gate_crossing(self, previous_position, previous_time, position, timestamp, gate = None):
+        # Returns the interpolated ticks at which the segment between both fixes crosses the
+        # gate ([x, y, direction x, direction y], start/finish by default) in its direction, None if it doesn't
+        if gate is None:
+            origin_x = origin_y = 0
+            direction_x, direction_y = self.gate_direction
+        else:
+            origin_x, origin_y, direction_x, direction_y = gate
+        previous_x = previous_position[0] - origin_x
+        previous_y = previous_position[1] - origin_y
+        x = position[0] - origin_x
+        y = position[1] - origin_y
+        previous_distance = previous_x * direction_x + previous_y * direction_y
+        distance = x * direction_x + y * direction_y
+        if not (previous_distance < 0 <= distance): # Signed distances to the line, along the heading
+            return None
+        ratio = -previous_distance / (distance - previous_distance)
+        crossing_x = previous_x + ratio * (x - previous_x)
+        crossing_y = previous_y + ratio * (y - previous_y)
+        if abs(crossing_x * direction_y - crossing_y * direction_x) > self.gate_width / 2: # Beside the gate
+            return None
+        return time.ticks_add(previous_time, round(ratio * time.ticks_diff(timestamp, previous_time)))
+
     def end(self):
         logging.info("> Timer ended")
         now = time.ticks_ms()
@@ -188,12 +455,29 @@ class LapTimer(Timer_):
         self.reset()
         self.start_time = None
         self.start_position = None
-        self.previous_update['distance'] = 0
+        self.track = None
+        self.armed = False
+        self.session = None
+        self.lap_max_speed = 0
+        self.previous_update['position'] = None
+        self.previous_update['timestamp'] = None
         self.number_of_lap = 1
         self.display_delay = 0
         self.display_laps = 0
         self.fastest_lap = None
         self.delay = 0
+        self.trace.clear()
+        self.best_trace.clear()
+        self.lap_distance = 0
+        self.reference_index = 0
+        self.live_delta = None
+        self.sector_gates = []
+        self.next_sector = 0
+        self.sector_start = None
+        self.sector_times = []
+        self.best_sectors = []
+        self.split = None
+        self.display_split = 0
         
                 
             
@@ -0,0 +1,71 @@
+import ujson as json
+from math import floor, cos, radians
+import logging
+
+tracks_file = 'tracks.json'
+
+class TrackDatabase:
+    # Known circuits from tracks.json, each one a name, a start/finish gate and optional sector gates:
+    # {"name": "...", "start": {"latitude": .., "longitude": .., "course": ..}, "sectors": [gates]}
+    # in signed decimal degrees, negative in the southern and western hemispheres.
+    # Tracks are indexed by a 0.1° grid (about 11km): finding the nearest one only looks at
+    # the tracks of the current cell and its 8 neighbours, however large the database is.
+    def __init__(self, cell_size = 0.1):
+        self.cell_size = cell_size
+        self.tracks = []
+        self.grid = {}
+        try:
+            with open(tracks_file, 'r') as file:
+                tracks = json.load(file)
+        except (OSError, ValueError):
+            logging.warn(f"> {tracks_file} not found, no known track")
+            tracks = []
+        for track in tracks:
+            self.index(track)
+        logging.info(f"> {len(self.tracks)} tracks loaded")
+
+    def cell(self, latitude, longitude):
+        return (floor(latitude / self.cell_size), floor(longitude / self.cell_size))
+
+    def index(self, track):
+        try:
+            key = self.cell(track['start']['latitude'], track['start']['longitude'])
+        except (KeyError, TypeError):
+            logging.error(f"> Invalid track: {track}")
+            return
+        self.tracks.append(track)
+        self.grid.setdefault(key, []).append(track)
+
+    def find(self, latitude, longitude, radius = 1000):
+        # Track whose start/finish gate is the closest to the position, None if none is within radius (m)
+        row, column = self.cell(latitude, longitude)
+        longitude_to_meters = 111320 * cos(radians(latitude))
+        nearest = None
+        nearest_distance = radius ** 2
+        for delta_row in (-1, 0, 1):
+            for delta_column in (-1, 0, 1):
+                for track in self.grid.get((row + delta_row, column + delta_column), ()):
+                    x = (track['start']['longitude'] - longitude) * longitude_to_meters
+                    y = (track['start']['latitude'] - latitude) * 111320
+                    distance = x ** 2 + y ** 2
+                    if distance < nearest_distance:
+                        nearest = track
+                        nearest_distance = distance
+        return nearest
+
+    def add(self, latitude, longitude, course, name = None, sectors = None):
+        # Records a start/finish gate set by hand, so the lap timer arms itself there next time
+        track = {'name': name or f"TRACK{len(self.tracks) + 1}",
+                 'start': {'latitude': latitude, 'longitude': longitude, 'course': course},
+                 'sectors': sectors if sectors is not None else []}
+        self.index(track)
+        self.save()
+        logging.car(f"> New track: {track['name']}")
+        return track
+
+    def save(self):
+        try:
+            with open(tracks_file, 'w') as file:
+                json.dump(self.tracks, file)
+        except OSError:
+            logging.error(f"> Unable to save {tracks_file}")
@@ -0,0 +1,100 @@
+import time
+import logging
+from records import RecordIndex
+
+TRIPS = ('A', 'B', 'REFUEL')
+
+class TripComputer:
+    # Fuel used (L), distance (km) and driving time (s) of trips A, B and since the last refuel.
+    # Fuel flow and speed are integrated at every loop into a pending step, folded into the
+    # trips once a second: the increments stay large enough for single precision floats,
+    # and each loop costs the same few multiply-adds whatever the number of trips.
+    def __init__(self, file = 'trips.json', fold_interval_ms = 1000, save_interval_ms = 60000, refuel_threshold = 5, max_step_ms = 5000):
+        self.store = RecordIndex(file, {})
+        self.trips = {}
+        for name in TRIPS:
+            self.trips[name] = self.store.data.get(name) or [0.0, 0.0, 0.0]
+        self.tank_low = self.store.data.get('tank_low') # L, lowest tank level since the last refuel
+        self.fold_interval_ms = fold_interval_ms
+        self.save_interval_ms = save_interval_ms
+        self.refuel_threshold = refuel_threshold # L, a higher tank level while stopped is a refuel
+        self.max_step_ms = max_step_ms # A blocked loop still counts, up to this long
+        self.pending = [0.0, 0.0, 0.0] # Fuel, distance and time not yet folded into the trips
+        self.last_update = None # None after a boot or a power off: the gap before isn't measured
+        self.last_fold = time.ticks_ms()
+        self.last_save = time.ticks_ms()
+
+    def update(self, fuel_per_hour, speed_kmh):
+        # Called at every loop with the instantaneous fuel flow (L/h) and speed (km/h)
+        now = time.ticks_ms()
+        if self.last_update is not None:
+            dt = min(time.ticks_diff(now, self.last_update), self.max_step_ms)
+            pending = self.pending
+            pending[0] += fuel_per_hour * dt / 3600000
+            pending[1] += speed_kmh * dt / 3600000
+            if fuel_per_hour > 0 or speed_kmh > 0: # Engine running
+                pending[2] += dt / 1000
+        self.last_update = now
+        if time.ticks_diff(now, self.last_fold) >= self.fold_interval_ms:
+            self.fold()
+            self.last_fold = now
+            if time.ticks_diff(now, self.last_save) >= self.save_interval_ms:
+                self.save()
+
+    def fold(self):
+        pending = self.pending
+        for trip in self.trips.values():
+            trip[0] += pending[0]
+            trip[1] += pending[1]
+            trip[2] += pending[2]
+        pending[0] = pending[1] = pending[2] = 0.0
+
+    def save(self):
+        self.fold()
+        for name in TRIPS:
+            self.store.data[name] = self.trips[name]
+        self.store.data['tank_low'] = self.tank_low
+        self.store.save()
+        self.last_save = time.ticks_ms()
+
+    def pause(self):
+        # At power off: saved, and the time until the next update isn't integrated
+        self.save()
+        self.last_update = None
+
+    def reset(self, name):
+        self.fold()
+        self.trips[name] = [0.0, 0.0, 0.0]
+        self.save()
+        logging.car(f"> Trip {name} reset")
+
+    def check_refuel(self, tank_level, stationary):
+        # tank_level in L, from the filtered sender. Only trusted while stopped, it sloshes otherwise
+        if not stationary:
+            return
+        if self.tank_low is None or tank_level < self.tank_low:
+            self.tank_low = tank_level
+        elif tank_level > self.tank_low + self.refuel_threshold:
+            logging.car(f"> Refuel detected, {self.tank_low:.0f}L to {tank_level:.0f}L")
+            self.tank_low = tank_level
+            self.reset('REFUEL')
+
+    def consumption(self, name):
+        # L/100km, None until the trip is long enough to mean something
+        fuel, distance, _ = self.trips[name]
+        if distance < 1:
+            return None
+        return fuel / distance * 100
+
+    def range(self, tank_level, min_distance = 20):
+        # km left with the fuel in the tank, at the average consumption since the refuel,
+        # or of the longest trip when too little was driven since
+        name = 'REFUEL'
+        if self.trips[name][1] < min_distance:
+            name = max(TRIPS, key = lambda trip: self.trips[trip][1])
+        if self.trips[name][1] < min_distance:
+            return None
+        consumption = self.consumption(name)
+        if not consumption:
+            return None
+        return tank_level / consumption * 100
@@ -5,6 +5,7 @@ class Unit:
         self.system = system
         self.speed_acronym = None
         self.speed_index = None
+        self.speed_factor = None # From km/h
         self.pressure_acronym = None
         self.temperature_acronym = None
         self.altitude_acronym = None
@@ -31,8 +32,10 @@ class Unit:
     def set_speed_index(self):
         if self.system == 'METRIC':
             self.speed_index = 2
+            self.speed_factor = 1
         elif self.system == 'IMPERI.':
             self.speed_index = 1
+            self.speed_factor = 1.151 / 1.852
             
     def set_pressure_acronym(self):
         if self.system == 'METRIC':
@@ -1,5 +1,6 @@
 from utime import sleep_ms
 from math import sqrt, degrees, acos, atan2
+from array import array
 
 
 def default_wait():
@@ -13,11 +14,15 @@ class Vector3d(object):
     '''
     Represents a vector in a 3D space using Cartesian coordinates.
     Internally uses sensor relative coordinates.
-    Returns vehicle-relative x, y and z values.
+    Returns vehicle-relative x, y and z values of the last sample:
+    call refresh() (or the sensor's snapshot()) to take a new one.
     '''
+    __slots__ = ('_vector', '_ivector', '_xyz', 'cal', '_scale', '_transpose', 'update')
+
     def __init__(self, transposition, scaling, update_function):
         self._vector = [0, 0, 0]
-        self._ivector = [0, 0, 0]
+        self._ivector = array('h', [0, 0, 0])  # Raw int16 sample, decoded in place by the sensor
+        self._xyz = [0, 0, 0]                   # Corrected, vehicle relative values of the last sample
         self.cal = (0, 0, 0)
         self.argcheck(transposition, "Transposition")
         self.argcheck(scaling, "Scaling")
@@ -47,6 +52,23 @@ class Vector3d(object):
             maxvec = list(map(max, maxvec, self._vector))
             minvec = list(map(min, minvec, self._vector))
         self.cal = tuple(map(lambda a, b: (a + b)/2, maxvec, minvec))
+        self.correct()
+
+    def refresh(self):
+        '''
+        Reads a new sample from the sensor
+        '''
+        self.update()
+        self.correct()
+
+    def correct(self):
+        '''
+        Applies calibration, transposition and scaling to the raw sample.
+        Called by refresh(), or by the sensor after it filled _vector itself.
+        '''
+        for i in range(3):
+            axis = self._transpose[i]
+            self._xyz[i] = (self._vector[axis] - self.cal[axis]) * self._scale[i]
 
     @property
     def _calvector(self):
@@ -57,25 +79,19 @@ class Vector3d(object):
 
     @property
     def x(self):                                # Corrected, vehicle relative floating point values
-        self.update()
-        return self._calvector[self._transpose[0]] * self._scale[0]
+        return self._xyz[0]
 
     @property
     def y(self):
-        self.update()
-        return self._calvector[self._transpose[1]] * self._scale[1]
+        return self._xyz[1]
 
     @property
     def z(self):
-        self.update()
-        return self._calvector[self._transpose[2]] * self._scale[2]
+        return self._xyz[2]
 
     @property
     def xyz(self):
-        self.update()
-        return (self._calvector[self._transpose[0]] * self._scale[0],
-                self._calvector[self._transpose[1]] * self._scale[1],
-                self._calvector[self._transpose[2]] * self._scale[2])
+        return tuple(self._xyz)
 
     @property
     def magnitude(self):